@@ -35,13 +35,13 @@ import pathlib
 import re
 import shlex
 import shutil
-import struct
 import subprocess
 import sys
+import threading
 import wave
 import zipfile
 import filecmp
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 try:
     import numpy
 except ImportError:
@@ -78,9 +78,10 @@ SQAM_SHA256 = '7d6fcd0fc42354637291792534b61bf129612f221f8efef97b62e8942a8686aa'
 SOX_URL = 'https://sourceforge.net/projects/sox/files/sox/14.4.2/sox-14.4.2-win32.zip'
 SOX_SHA256 = '8072cc147cf1a3b3713b8b97d6844bb9389e211ab9e1101e432193fad6ae6662'
 SOX_EXE = pathlib.Path('SoX', 'sox-14.4.2', 'sox.exe')
-RMS_EXE = './rms' if sys.platform != 'cygwin' else './rms.exe'
+REFERENCE_EXE = pathlib.Path('LC3_bin_current', 'LC3.exe')
 REFERENCE_ENCODER = 'LC3_bin_current/LC3.exe -E -q {options} "{input}" "{output}" {bitrate}'
 REFERENCE_DECODER = 'LC3_bin_current/LC3.exe -D -q {options} "{input}" "{output}"'
+REFERENCE_CACHE = pathlib.Path('lc3_reference_cache') # None disables the cache
 
 ITEM_DIR = pathlib.Path('test_items')
 ITEMS = {  # start, frag, SQAM name
@@ -227,8 +228,6 @@ def check_system(globvars):
         sys.exit('Curl not found')
     if sys.platform != 'cygwin' and not exe_exists('wine'):
         sys.exit("Wine not found")
-    if not exe_exists('gcc'):
-        sys.exit("Gcc not found")
     if not exe_exists(globvars['peaq_bin'], wine=True):
         sys.exit('{} not found. \nPlease install a PEAQ compliant tool (e.g. PEAQ ITU-BS.1387) and adjust config file'
                  .format(globvars['peaq_bin']))
@@ -246,64 +245,87 @@ def regex_search(expr, s):
     return re.search(expr, s).group(1)
 
 
-# calculates the max xcorr of the two vectors 
+# cross correlation sum(a[k] * b[k + i]) over the common length for the lags 0 <= i < nlags,
+# overlap-save on blocks of a, the spectra of the blocks are summed
+def xcorr(a, b, nlags, size=8192):
+    n = min(len(a), len(b))
+    block = size - nlags
+    nblocks = -(-n // block)
+    ap = numpy.zeros(nblocks * block)
+    ap[:n] = a[:n]
+    bp = numpy.zeros(nblocks * block + size)
+    bp[:n] = b[:n]
+    fa = numpy.fft.rfft(ap.reshape(nblocks, block), size)
+    fb = numpy.fft.rfft(bp[numpy.arange(nblocks)[:, None] * block + numpy.arange(size)], size)
+    return numpy.fft.irfft((numpy.conj(fa) * fb).sum(axis=0), size)[:nlags]
+
+
+# calculates the max xcorr of the two int16 vectors 
 def align_vec(x1, x2):
     # trims second vector(tst) to be in sync with first(ref)
-    res = []
     # normalize to max of int16
-    a = numpy.float32(x1) / 32767
+    a = x1.astype(numpy.float32) / 32767
     # padd with zeros in beginning
-    x2 = (0,)*MAX_DELAY + x2
-    b = numpy.float32(x2) / 32767
+    x2 = numpy.concatenate((numpy.zeros(MAX_DELAY, numpy.int16), x2))
+    b = x2.astype(numpy.float32) / 32767
 
-    for i in range(2*MAX_DELAY + 1):
+    def dot(i):
         xlen = min(len(a),len(b)) - i
-        xx = numpy.dot(a[0:xlen], b[i:xlen+i])
-        res.append(xx)
-    lag = numpy.array(res).argmax()
-    x2 = x2[lag:]
-    # padd/trim second vector(tst)
-    logging.debug('[{}] Compensated delay: {} samples'.format(datetime.datetime.now().strftime('%H:%M:%S'), MAX_DELAY - lag))
-    if len(x1)>len(x2):
-        x2 = x2 + (0,)*(len(x1)-len(x2)) 
+        return numpy.dot(a[0:xlen], b[i:xlen+i])
+
+    nlags = 2*MAX_DELAY + 1
+    n = min(len(a), len(b))
+    if n < nlags:
+        res = [dot(i) for i in range(nlags)]
+        lag = numpy.array(res).argmax()
     else:
-        x2 = x2[:len(x1)]
-    return x2
+        # exact correlation of all lags, then the float32 dot products only for
+        # the lags within the float32 rounding error of the maximum, so near ties
+        # are decided as with a dot product for every lag
+        a64, b64 = a[:n].astype(numpy.float64), b[:n].astype(numpy.float64)
+        res = xcorr(a64, b64, nlags)
+        err = 4 * numpy.sqrt(n) * numpy.finfo(numpy.float32).eps * numpy.sqrt(numpy.dot(a64, a64) * numpy.dot(b64, b64))
+        candidates = numpy.flatnonzero(res >= res.max() - 2 * err)
+        lag = candidates[numpy.array([dot(i) for i in candidates]).argmax()]
+    logging.debug('[{}] Compensated delay: {} samples'.format(datetime.datetime.now().strftime('%H:%M:%S'), MAX_DELAY - lag))
+    # padd/trim second vector(tst)
+    y2 = numpy.zeros(len(x1), numpy.int16)
+    x2 = x2[lag:lag + len(x1)]
+    y2[:len(x2)] = x2
+    return y2
+
 
+# read the samples of a wav file as a read-only int16 view of the data, and its parameters
+def read_wav(path):
+    with wave.open(str(path), 'rb') as wf:
+        return numpy.frombuffer(wf.readframes(wf.getnframes()), '<i2'), wf.getparams()
 
-# convert byte objects to signed int16
-def byte_to_float(b, frames, channels):
-    return struct.unpack("%ih" % (frames * channels), b)
 
+def write_wav(path, x, params):
+    with wave.open(str(path), 'wb') as wf:
+        wf.setparams(params)
+        wf.setnframes(len(x))
+        wf.writeframes(x.astype('<i2', copy=False).tobytes())
 
-# trim/padd file_2 to be in sync with file_1 and write to file_2.aligned.wav
-def align_files(file_1, file_2, file_2_out):
+
+# trim/padd file_2 to be in sync with file_1, returns the aligned samples and the parameters of
+# file_2, the aligned samples are written to file_2_out if given
+def align_files(file_1, file_2, file_2_out=None):
     logging.debug('[{}] File alignment:\nFile to be aligned: "{}"\nReference file: "{}"\nAligned output file: "{}"'.format(datetime.datetime.now().strftime('%H:%M:%S'), file_2,file_1,file_2_out))
-    file_1, file_2, file_2_out = str(file_1), str(file_2), str(file_2_out)
     # read in audio files
-    with wave.open(file_1, 'rb') as wf1, wave.open(file_2, 'rb') as wf2:
-        if abs(wf1.getnframes() - wf2.getnframes()) > MAX_SAMPLES_PER_FRAME:
-            print('The difference between the number of samples in {} and {} is higher than {}'.format(file_1,file_2, MAX_SAMPLES_PER_FRAME))
-            print('{}: {} samples'.format(file_1,wf1.getnframes()))
-            print('{}: {} samples'.format(file_2,wf2.getnframes()))
-            exit()
-        b1 = wf1.readframes(wf1.getnframes())
-        b2 = wf2.readframes(wf2.getnframes())
-        x1 = byte_to_float(b1, wf1.getnframes(), wf1.getnchannels())
-        x2 = byte_to_float(b2, wf2.getnframes(), wf2.getnchannels())
-        par2 = wf2.getparams()
+    x1, par1 = read_wav(file_1)
+    x2, par2 = read_wav(file_2)
+    if abs(par1.nframes - par2.nframes) > MAX_SAMPLES_PER_FRAME:
+        print('The difference between the number of samples in {} and {} is higher than {}'.format(file_1,file_2, MAX_SAMPLES_PER_FRAME))
+        print('{}: {} samples'.format(file_1,par1.nframes))
+        print('{}: {} samples'.format(file_2,par2.nframes))
+        exit()
     # measure cross correlation -> delay between files and return trimmed vector
     y2 = align_vec(x1, x2)
     # write output file
-    with wave.open(file_2_out, 'wb') as wf2:
-        wf2.setparams(par2)
-        wf2.setnframes(len(y2))
-        b2 = struct.pack("%ih" % len(y2), *y2)
-        wf2.writeframes(b2)
-
-
-def build_tools():
-    call('gcc -o rms rms.c -lm')
+    if file_2_out:
+        write_wav(file_2_out, y2, par2)
+    return y2, par2
 
 
 # call sox with args in repeatable mode, lazy skips execution if output already exists
@@ -323,6 +345,182 @@ def low_pass(infile, outfile, fs, fc, lazy=False):
     resample(tmpfile, outfile, fs, lazy=lazy)
 
 
+# sha256 of a file, remembered per path, size and modification time
+FILE_HASHES = {}
+def file_hash(path):
+    st = os.stat(str(path))
+    key = (str(path), st.st_size, st.st_mtime_ns)
+    if key not in FILE_HASHES:
+        with open(str(path), 'rb') as f:
+            FILE_HASHES[key] = hashlib.sha256(f.read()).hexdigest()
+    return FILE_HASHES[key]
+
+
+# key of a step from the content of its input files and its other arguments
+def step_key(inputs, *args):
+    key = hashlib.sha256()
+    for x in [file_hash(f) for f in inputs] + list(args):
+        key.update(str(x).encode() + b'\0')
+    return key.hexdigest()
+
+
+# Steps of a run by key. A step runs once, a later step with the same key, also from another section or
+# thread, waits for the first one and gets its result.
+RUN_STEPS = {}
+RUN_STEPS_LOCK = threading.Lock()
+def run_once(key, func):
+    with RUN_STEPS_LOCK:
+        step = RUN_STEPS.get(key)
+        first = step is None
+        if first:
+            step = RUN_STEPS[key] = Future()
+    if first:
+        try:
+            step.set_result(func())
+        except BaseException as e:
+            step.set_exception(e)
+    return step.result()
+
+
+# run a step writing outputs once, func returns the files written, which are copied to outputs if needed
+def run_files_once(key, func, outputs):
+    for source, output in zip(run_once(key, func), outputs):
+        if str(source) != str(output):
+            logging.debug('reused: {} -> {}'.format(source, output))
+            shutil.copyfile(str(source), str(output))
+
+
+def run_file_once(key, func, output):
+    run_files_once(key, lambda: [func()], [output])
+
+
+# write a cache entry under a temporary name first, concurrent runs only ever see complete files
+def cache_store(cached, write):
+    makedirs(cached.parent)
+    tmpfile = cached.with_name('{}.{}.{}.tmp'.format(cached.name, os.getpid(), threading.get_ident()))
+    write(tmpfile)
+    os.replace(str(tmpfile), str(cached))
+
+
+# Run a step writing output once per key like run_file_once. The output is also stored in the cache, a
+# later run with the same key copies it from the cache instead of running the step.
+def cached_file_once(key, func, output):
+    cached = REFERENCE_CACHE / (key + pathlib.Path(output).suffix) if REFERENCE_CACHE else None
+
+    def step():
+        if cached and is_file(cached):
+            logging.debug('cached: {}'.format(output))
+            return cached
+        source = func()
+        if cached:
+            cache_store(cached, lambda tmpfile: shutil.copyfile(str(source), str(tmpfile)))
+        return source
+
+    run_file_once(key, step, output)
+
+
+# Run a reference codec command writing output, once per hash of the LC3.exe binary, the input files and
+# args. The output is kept in the cache across runs.
+def cached_call(cmd, inputs, output, *args):
+    def func():
+        call(cmd)
+        return output
+    cached_file_once(step_key([REFERENCE_EXE] + inputs, *args), func, output)
+
+
+# reference encoder, bitrate can be a bitrate switching file
+def reference_encode(infile, outfile, bitrate, frame_ms):
+    options = '-frame_ms ' + frame_ms
+    inputs = [infile, bitrate] if is_file(bitrate) else [infile]
+    cached_call(REFERENCE_ENCODER.format(input=infile, output=outfile, bitrate=bitrate, options=options),
+                inputs, outfile, 'encode', bitrate, options)
+
+
+def reference_decode(infile, outfile, options=''):
+    cached_call(REFERENCE_DECODER.format(input=infile, output=outfile, options=options),
+                [infile], outfile, 'decode', options)
+
+
+# encoder or decoder under test, runs once per content of the input and the other fields of the template
+def codec_call(template, infile, outfile, **fields):
+    inputs = [infile, fields['bitrate']] if is_file(fields.get('bitrate', '')) else [infile]
+    key = step_key(inputs, template, *sorted(fields.items()))
+
+    def func():
+        call(template.format(input=infile, output=outfile, **fields))
+        return outfile
+
+    run_file_once(key, func, outfile)
+
+
+# encoder and decoder under test in one call writing binfile and outfile, runs once like codec_call
+def encdec_call(template, infile, binfile, outfile, **fields):
+    inputs = [infile, fields['bitrate']] if is_file(fields.get('bitrate', '')) else [infile]
+    key = step_key(inputs, template, *sorted(fields.items()))
+
+    def func():
+        call(template.format(input=infile, bin=binfile, output=outfile, **fields))
+        return binfile, outfile
+
+    run_files_once(key, func, [binfile, outfile])
+
+
+# the sox binary is part of the key of cached resampling steps
+def sox_key():
+    return file_hash(SOX_EXE) if is_file(SOX_EXE) else str(SOX_EXE)
+
+
+# resample once per content of infile, cached selects the cache across runs
+def resample_once(infile, outfile, fs, cached=False):
+    def func():
+        resample(infile, outfile, fs)
+        return outfile
+
+    key = step_key([infile], 'resample', fs, sox_key())
+    (cached_file_once if cached else run_file_once)(key, func, outfile)
+
+
+# ODG of test against reference, PEAQ runs once per content of the two files
+def peaq_odg(config, reference, test):
+    def func():
+        out = call(config['peaq_bin'].format(reference=reference, test=test))
+        return float(regex_search(config['peaq_odg_regex'], out))
+    return run_once(step_key([reference, test], 'peaq', config['peaq_bin'], config['peaq_odg_regex']), func)
+
+
+# hash of the executable of a command line and of the files among its arguments, so replacing a
+# program run through wine or an interpreter changes it. The executable is looked up on the PATH if it
+# isn't a file.
+def exe_hash(cmd):
+    exe, *args = shlex.split(cmd)
+    path = exe if is_file(exe) else shutil.which(exe)
+    if path is None:
+        raise FileNotFoundError('{} not found'.format(exe))
+    return step_key([path] + [arg for arg in args if is_file(arg)])
+
+
+# ODG of the reference decode against the input. It doesn't depend on the codec under test, so it is
+# kept in the cache per content of the input, the reference decode and the PEAQ binary, ref_al is only
+# resampled and compared by PEAQ if the cache has no entry.
+def reference_odg(config, infile, reference, in48, ref_al):
+    key = step_key([infile, reference], 'odg_ref', MAX_DELAY, sox_key(), exe_hash(config['peaq_bin']), config['peaq_bin'],
+                   config['peaq_odg_regex'])
+    cached = REFERENCE_CACHE / (key + '.odg') if REFERENCE_CACHE else None
+
+    def step():
+        if cached and is_file(cached):
+            logging.debug('cached: ODG of {}'.format(reference))
+            return float(cached.read_text())
+        ref48 = ref_al.with_suffix('.48k.wav')
+        resample_once(ref_al, ref48, 48000)
+        odg = peaq_odg(config, in48, ref48)
+        if cached:
+            cache_store(cached, lambda tmpfile: tmpfile.write_text(repr(odg)))
+        return odg
+
+    return run_once(key, step)
+
+
 # apply func to list of argumets,
 def thread_executor(func, args, workers):
     list(ThreadPoolExecutor(workers).map(lambda x: func(*x), args)) # list() to collect futures
@@ -404,6 +602,7 @@ def parse_config(path):
         sys.exit('No such file: ' + path)
 
     glob_keys = ['enabled_tests', 'encoder', 'decoder', 'peaq_bin', 'peaq_odg_regex', 'frame_ms']
+    opt_glob_keys = ['encdec']
     bool_keys = ['test_sqam', 'test_band_limiting',
 	             'test_low_pass', 'test_rate_switching']
     str_keys  = ['options']
@@ -415,9 +614,11 @@ def parse_config(path):
         # parse global section
         for key in glob_keys:
             globvars[key] = strip_comment(parser['globals'][key])
+        for key in opt_glob_keys:
+            globvars[key] = strip_comment(parser['globals'][key]) if key in parser['globals'] else None
         globvars['enabled_tests'] = split_list(parser['globals']['enabled_tests'])
         for key in parser['globals']:
-            if key not in glob_keys:
+            if key not in glob_keys + opt_glob_keys:
                 sys.exit('Unknown key "{}" in config'.format(key))
         # parse test sections
         for test in globvars['enabled_tests']:
@@ -468,6 +669,28 @@ def check_odg(mode, config, odg_ref, odg_tst, odg_thr_key):
     return ok, result
 
 
+# different samples, max. abs. difference, overall RMS in dB and reached RMS criteria in bits of
+# the int16 samples of tst vs. ref, as calculated and printed by rms.c: float arithmetic with the
+# squared differences summed in order, the difference printed with %e and the RMS with %f
+def calc_rms(ref, tst, params):
+    scale = numpy.float32(1 << 15)
+    diff = ref.astype(numpy.float32) / scale - tst.astype(numpy.float32) / scale
+    diff_samp = int(numpy.count_nonzero(diff))
+    diff_max = numpy.float32(numpy.abs(diff).max()) if len(diff) else numpy.float32(0)
+    # samples are read 10 ms at a time, the channels of the last partial read are counted twice
+    chunk = params.framerate // 100 * params.nchannels
+    total = len(ref) // chunk * chunk + len(ref) % chunk * params.nchannels
+    acc = numpy.add.accumulate(diff * diff, dtype=numpy.float32)[-1] if len(diff) else numpy.float32(0)
+    rms = numpy.float32(math.sqrt(acc / numpy.float32(total)))
+    rms = numpy.float32(20.0 * math.log10(rms)) if rms > 0 else numpy.float32(-numpy.inf)
+    for bits in range(16, 0, -1):
+        if rms < numpy.float32(20.0 * math.log10(math.pow(2, -(bits - 1)) / math.sqrt(12.0))):
+            break
+    else:
+        bits = 0
+    return diff_samp, float('%e' % diff_max), float('%f' % rms), bits
+
+
 def check_rms(mode, config, rms, bits, diff):
     rms_bits = config[mode + '_rms_threshold']
     rms_thr = 20 * math.log10(2 ** (-rms_bits + 1) / 12 ** 0.5)
@@ -486,31 +709,26 @@ def compare_wav(infile, reference, test, config, rms_thr_key, odg_thr_key=None):
     ref_al = reference.with_suffix('.aligned.wav')
     tst_al = test.with_suffix('.aligned.wav')
 
-    align_files(infile, reference, ref_al)
-    align_files(infile, test, tst_al)
+    # the aligned files are only written for PEAQ or to keep them
+    write_aligned = config.get('keep_files') or 'peaq' in config['metric']
+    ref_y, ref_par = align_files(infile, reference, ref_al if write_aligned else None)
+    tst_y, tst_par = align_files(infile, test, tst_al if write_aligned else None)
 
     if 'peaq' in config['metric']:
         in48 = infile.with_suffix('.48k.wav')
-        ref48 = ref_al.with_suffix('.48k.wav')
         tst48 = tst_al.with_suffix('.48k.wav')
-        resample(infile, in48, 48000)
-        resample(ref_al, ref48, 48000)
-        resample(tst_al, tst48, 48000)
+        resample_once(infile, in48, 48000, cached=True)
+        resample_once(tst_al, tst48, 48000)
         # calculate odg between input and reference / test
-        out_ref = call(config['peaq_bin'].format(reference=in48, test=ref48))
-        odg_ref = float(regex_search(config['peaq_odg_regex'], out_ref))
-        out_tst = call(config['peaq_bin'].format(reference=in48, test=tst48))
-        odg_tst = float(regex_search(config['peaq_odg_regex'], out_tst))
+        odg_ref = reference_odg(config, infile, reference, in48, ref_al)
+        odg_tst = peaq_odg(config, in48, tst48)
         ok_peaq, result_peaq = check_odg(mode, config, odg_ref, odg_tst, odg_thr_key)
 
     if 'rms' in config['metric']:
         # calculate rms between reference and test
-        out = call('{} {} {} {}'.format(RMS_EXE, ref_al, tst_al, config[rms_thr_key]))
-        diff_samp = int(regex_search(r'different samples\s+: (\d+)', out))
+        diff_samp, diff, rms, bits = calc_rms(ref_y, tst_y, ref_par)
         if diff_samp != 0:
-            rms = float(regex_search(r'Overall RMS value\s+: (\S+) dB ---', out))
-            diff = float(regex_search(r'Maximum difference\s+: (\S+) ---', out))
-            bits = int(regex_search(r'RMS criteria\s+: (\d+) bit', out))
+            logging.debug('Different samples: {}, max. abs. diff: {:e}, RMS: {:f} dB, RMS criteria: {} bit'.format(diff_samp, diff, rms, bits))
         else:
             rms, diff, bits = -999, 0, 24
         ok_rms, result_rms = check_rms(mode, config, rms, bits, diff)
@@ -553,19 +771,19 @@ def test_rate_switching(work_dir, test, config, workers):
             cfg = ('rate_switching_enc', item, fs, br)
             file_names = ['tst.bin', 'ref.bin', 'ref_ref.wav', 'tst_ref.wav']
             tst_bin, ref_bin, ref_ref, tst_ref = make_files(file_names, work_dir, test, *cfg)
-            call(config['encoder'].format(input=infile, output=tst_bin, bitrate='swf_encoder.dat', frame_ms=config['frame_ms'], options=''))
-            call(REFERENCE_ENCODER.format(input=infile, output=ref_bin, bitrate='swf_encoder.dat', options='-frame_ms ' + config['frame_ms']))
-            call(REFERENCE_DECODER.format(input=tst_bin, output=tst_ref, options=''))
-            call(REFERENCE_DECODER.format(input=ref_bin, output=ref_ref, options=''))
+            codec_call(config['encoder'], infile, tst_bin, bitrate='swf_encoder.dat', frame_ms=config['frame_ms'], options='')
+            reference_encode(infile, ref_bin, 'swf_encoder.dat', config['frame_ms'])
+            reference_decode(tst_bin, tst_ref)
+            reference_decode(ref_bin, ref_ref)
             return cfg, compare_wav(infile, ref_ref, tst_ref, config, 'rate_switching_enc_rms_threshold')
         if mode == 'decode':
             print_test('bitrate switching ' + mode, item, fs, "swf_decoder.dat")
             cfg = ('rate_switching_dec', item, fs, br)
             file_names = ['ref.bin', 'ref_ref.wav', 'ref_tst.wav']
             ref_bin, ref_ref, ref_tst = make_files(file_names, work_dir, test, *cfg)
-            call(REFERENCE_ENCODER.format(input=infile, output=ref_bin, bitrate='swf_decoder.dat', options='-frame_ms ' + config['frame_ms']))
-            call(REFERENCE_DECODER.format(input=ref_bin, output=ref_ref, options=''))
-            call(config['decoder'].format(input=ref_bin, output=ref_tst, options=''))
+            reference_encode(infile, ref_bin, 'swf_decoder.dat', config['frame_ms'])
+            reference_decode(ref_bin, ref_ref)
+            codec_call(config['decoder'], ref_bin, ref_tst, options='')
             return cfg, compare_wav(infile, ref_ref, ref_tst, config, 'rate_switching_dec_rms_threshold')
 
     tests = sqam_configs(config, modes=['encode', 'decode'], bitrates=['NA'])
@@ -577,10 +795,10 @@ def test_rate_switching(work_dir, test, config, workers):
     cfg = ('rate_switching_ff', ITEM_RATE_SWITCHING, fs, br)
     file_names = ['ref.bin', 'tst.bin', 'ref_ref.wav', 'tst_tst.wav']
     ref_bin, tst_bin, ref_ref, tst_tst = make_files(file_names, work_dir, test, *cfg)
-    call(config['encoder'].format(input=infile, output=tst_bin, bitrate='swfFirstFrame.dat', frame_ms=config['frame_ms'], options=''))
-    call(config['decoder'].format(input=tst_bin, output=tst_tst, options=''))
-    call(config['encoder'].format(input=infile, output=ref_bin, bitrate=16000, frame_ms=config['frame_ms'], options=''))
-    call(config['decoder'].format(input=tst_bin, output=ref_ref, options=''))
+    codec_call(config['encoder'], infile, tst_bin, bitrate='swfFirstFrame.dat', frame_ms=config['frame_ms'], options='')
+    codec_call(config['decoder'], tst_bin, tst_tst, options='')
+    codec_call(config['encoder'], infile, ref_bin, bitrate=16000, frame_ms=config['frame_ms'], options='')
+    codec_call(config['decoder'], tst_bin, ref_ref, options='')
     result[cfg] = compare_wav(infile, ref_ref, tst_tst, config, 'rate_switching_ff_rms_threshold')
     return result
 
@@ -589,18 +807,22 @@ def test_item(work_dir, test, config, infile, mode, item, fs, br, compare=compar
     file_names = ['ref.bin', 'tst.bin', 'ref_ref.wav', 'tst_tst.wav', 'ref_tst.wav', 'tst_ref.wav']
     file_tuple = make_files(file_names, work_dir, test, mode, item, fs, br)
     ref_bin, tst_bin, ref_ref, tst_tst, ref_tst, tst_ref = file_tuple
-    call(REFERENCE_ENCODER.format(input=infile, output=ref_bin, bitrate=br, options='-frame_ms ' + config['frame_ms']))
-    call(REFERENCE_DECODER.format(input=ref_bin, output=ref_ref, options=''))
+    reference_encode(infile, ref_bin, br, config['frame_ms'])
+    reference_decode(ref_bin, ref_ref)
     if mode.startswith('encode'):
-        call(config['encoder'].format(input=infile, output=tst_bin, bitrate=br, frame_ms=config['frame_ms'], options=''))
-        call(REFERENCE_DECODER.format(input=tst_bin, output=tst_ref, options=''))
+        codec_call(config['encoder'], infile, tst_bin, bitrate=br, frame_ms=config['frame_ms'], options='')
+        reference_decode(tst_bin, tst_ref)
         return compare(infile, ref_ref, tst_ref, config, 'encode_rms_threshold')
     if mode.startswith('decode'):
-        call(config['decoder'].format(input=ref_bin, output=ref_tst, options=''))
+        codec_call(config['decoder'], ref_bin, ref_tst, options='')
         return compare(infile, ref_ref, ref_tst, config, 'decode_rms_threshold')
     if mode.startswith('encdec'):
-        call(config['encoder'].format(input=infile, output=tst_bin, bitrate=br, frame_ms=config['frame_ms'], options=''))
-        call(config['decoder'].format(input=tst_bin, output=tst_tst, options=''))
+        if config['encdec']:
+            # encode and decode in one call
+            encdec_call(config['encdec'], infile, tst_bin, tst_tst, bitrate=br, frame_ms=config['frame_ms'], options='')
+        else:
+            codec_call(config['encoder'], infile, tst_bin, bitrate=br, frame_ms=config['frame_ms'], options='')
+            codec_call(config['decoder'], tst_bin, tst_tst, options='')
         return compare(infile, ref_ref, tst_tst, config, 'encdec_rms_threshold')
 
 
@@ -634,10 +856,10 @@ def test_band_limiting(work_dir, test, config, workers):
         file_names = ['tst.bin', 'ref.bin', 'ref_ref.wav', 'tst_ref.wav']
         
         tst_bin, ref_bin, ref_ref, tst_ref = make_files(file_names, work_dir, test, *cfg)
-        call(config['encoder'].format(input=item_in, output=tst_bin, bitrate=br, frame_ms=config['frame_ms'], options=''))
-        call(REFERENCE_ENCODER.format(input=item_in, output=ref_bin, bitrate=br, options='-frame_ms ' + config['frame_ms']))
-        call(REFERENCE_DECODER.format(input=tst_bin, output=tst_ref, options=''))
-        call(REFERENCE_DECODER.format(input=ref_bin, output=ref_ref, options=''))
+        codec_call(config['encoder'], item_in, tst_bin, bitrate=br, frame_ms=config['frame_ms'], options='')
+        reference_encode(item_in, ref_bin, br, config['frame_ms'])
+        reference_decode(tst_bin, tst_ref)
+        reference_decode(ref_bin, ref_ref)
         return cfg, compare_wav(item_in, ref_ref, tst_ref, config, 'encode_rms_threshold')
 
     rates = set(fs for mode, fs, _ in config['configs'] if mode in ('encode', 'encdec'))
@@ -652,11 +874,9 @@ def test_band_limiting(work_dir, test, config, workers):
 
 
 def calc_energy(test):
-    with wave.open(str(test), 'rb') as tst_wf:
-        bytes_tst = tst_wf.readframes(tst_wf.getnframes())
-        tst = byte_to_float(bytes_tst, tst_wf.getnframes(), tst_wf.getnchannels())
-        eng = sum(numpy.square(tst))
-        return 10 * math.log10(eng)
+    tst, _ = read_wav(test)
+    eng = numpy.square(tst.astype(numpy.int64)).sum()
+    return 10 * math.log10(eng)
 
 
 def check_results(results):
@@ -754,6 +974,7 @@ def printLicense():
     print(LICENSE.format(VERSION))
 
 def main():
+    global SOX_EXE, REFERENCE_CACHE
     parser = argparse.ArgumentParser(description='Low Complexity Communication Codec - LC3: \n'
                                                  'Conformance Interoperability Test Software\n'
                                                  'Interoperability/Conformance Script V.{}\n'.format(VERSION))
@@ -762,11 +983,13 @@ def main():
     parser.add_argument('-keep', action="store_true", dest='keep_files', help='Keep all files (+log) produced in the test run')
     parser.add_argument('config', help='Conformance config file')
     parser.add_argument('-system_sox', action='store_true', help='Use system sox')
+    parser.add_argument('-cache', default=str(REFERENCE_CACHE), help='Cache directory for the reference outputs')
+    parser.add_argument('-no_cache', action='store_true', help="Don't read or write the cache directory")
     args = parser.parse_args()
     
-    global SOX_EXE
     if args.system_sox:
         SOX_EXE = 'sox'
+    REFERENCE_CACHE = None if args.no_cache else pathlib.Path(args.cache)
 
     time_stamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M')
     work_dir = makedirs(pathlib.Path('lc3_conformance_' + time_stamp))
@@ -777,7 +1000,6 @@ def main():
 
         globvars, tests = parse_config(args.config)
         check_system(globvars)
-        build_tools()
         if not args.system_sox:
             download_sox()
         prepare_items(args.workers)
@@ -787,6 +1009,7 @@ def main():
                       'test_sqam': test_sqam}
 
         for test, config in tests.items():
+            config['keep_files'] = args.keep_files
             results = {}
             for mode in sorted(test_modes):
                 if is_valid_mode(mode, config):
@@ -0,0 +1,5 @@
+import pathlib
+import sys
+
+# the script is run from its directory and isn't a package
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
@@ -0,0 +1,106 @@
+import pathlib
+import re
+import shutil
+import subprocess
+import wave
+
+import numpy
+import pytest
+
+from conformanceCheck import MAX_DELAY, align_vec, calc_rms, read_wav, write_wav
+
+SCRIPT_DIR = pathlib.Path(__file__).resolve().parent.parent
+
+
+# align_vec as it was before the cross-correlation, a float32 dot product for every lag
+def align_vec_loop(x1, x2):
+    a = numpy.float32(x1) / 32767
+    x2 = (0,)*MAX_DELAY + tuple(x2)
+    b = numpy.float32(x2) / 32767
+    res = []
+    for i in range(2*MAX_DELAY + 1):
+        xlen = min(len(a), len(b)) - i
+        res.append(numpy.dot(a[0:xlen], b[i:xlen+i]))
+    lag = numpy.array(res).argmax()
+    x2 = x2[lag:]
+    if len(x1) > len(x2):
+        x2 = x2 + (0,)*(len(x1) - len(x2))
+    else:
+        x2 = x2[:len(x1)]
+    return numpy.array(x2, numpy.int16)
+
+
+def delayed(x, delay, rng, noise):
+    y = numpy.roll(x, delay)
+    y = y + rng.normal(0, noise, len(y))
+    return numpy.clip(y, -32768, 32767).astype(numpy.int16)
+
+
+@pytest.mark.parametrize('n, delay, noise', [
+    (2*MAX_DELAY + 1, 3, 0),
+    (4000, 17, 10),
+    (48000, -120, 100),
+    (48000, MAX_DELAY, 0),
+    (96123, 250, 2000),
+])
+def test_align_vec_matches_loop(n, delay, noise):
+    rng = numpy.random.default_rng(n)
+    x1 = (rng.normal(0, 6000, n)).astype(numpy.int16)
+    x2 = delayed(x1, delay, rng, noise)
+    assert numpy.array_equal(align_vec(x1, x2), align_vec_loop(x1, x2))
+
+
+def test_align_vec_matches_loop_on_periodic_signal():
+    # a sine has maxima of nearly the same height one period apart
+    t = numpy.arange(20000)
+    x1 = (8000*numpy.sin(2*numpy.pi*t/100)).astype(numpy.int16)
+    x2 = numpy.concatenate((numpy.zeros(40, numpy.int16), x1[:-40]))
+    assert numpy.array_equal(align_vec(x1, x2), align_vec_loop(x1, x2))
+
+
+def test_align_vec_matches_loop_on_silence():
+    x1 = numpy.zeros(10000, numpy.int16)
+    assert numpy.array_equal(align_vec(x1, x1), align_vec_loop(x1, x1))
+
+
+@pytest.fixture(scope='module')
+def rms_exe(tmp_path_factory):
+    cc = shutil.which('cc') or shutil.which('gcc')
+    if cc is None:
+        pytest.skip('no C compiler for rms.c')
+    exe = tmp_path_factory.mktemp('rms') / 'rms'
+    subprocess.run([cc, '-O2', '-I', str(SCRIPT_DIR), str(SCRIPT_DIR / 'rms.c'), '-o', str(exe), '-lm'], check=True)
+    return exe
+
+
+# different samples, max. abs. difference, RMS and reached RMS criteria printed by rms.c
+def run_rms(rms_exe, ref, tst):
+    out = subprocess.run([str(rms_exe), str(ref), str(tst)], stdout=subprocess.PIPE, universal_newlines=True).stdout
+    def field(name):
+        return re.search(name + r'\s*: (\S+)', out).group(1)
+    return (int(field('Number of different samples')), float(field('Maximum difference')),
+            float(field('Overall RMS value')), int(field('Reached RMS criteria')))
+
+
+@pytest.mark.parametrize('framerate, nchannels, nframes, noise', [
+    (48000, 1, 48000, 3),
+    (44100, 2, 44100*2 + 123, 1),   # a partial read at the end
+    (16000, 1, 16000, 300),
+    (8000, 2, 7999, 0.4),
+])
+def test_calc_rms_matches_rms_c(tmp_path, rms_exe, framerate, nchannels, nframes, noise):
+    rng = numpy.random.default_rng(framerate + nchannels)
+    ref = rng.normal(0, 4000, nframes*nchannels).astype(numpy.int16)
+    tst = numpy.clip(ref + numpy.round(rng.normal(0, noise, len(ref))), -32768, 32767).astype(numpy.int16)
+
+    with wave.open(str(tmp_path / 'params.wav'), 'wb') as wf:
+        wf.setnchannels(nchannels)
+        wf.setsampwidth(2)
+        wf.setframerate(framerate)
+    params = read_wav(tmp_path / 'params.wav')[1]
+    write_wav(tmp_path / 'ref.wav', ref, params)
+    write_wav(tmp_path / 'tst.wav', tst, params)
+
+    ref_y, ref_par = read_wav(tmp_path / 'ref.wav')
+    tst_y, tst_par = read_wav(tmp_path / 'tst.wav')
+    assert calc_rms(ref_y, tst_y, ref_par) == run_rms(rms_exe, tmp_path / 'ref.wav', tmp_path / 'tst.wav')
@@ -38,19 +38,14 @@
  # LC3 interface using a UART transport.
  #
 
-import serial
 import sys
 import argparse
 import os
 from argparse import RawTextHelpFormatter
-from encoder import Encoder
-from decoder import Decoder
-from hci import HCI
-from pathlib import Path
-import fcntl
-
-
-lockfileName = "serial_lockfile.txt"
+from broker_client import BROKER_ENV, submit
+from bitstream import STDIO, console_to_stderr
+from manifest import read_manifest
+from checkpoint import PRIME_FRAMES
 
 # Setup the default serial port settings
 defaultBaud=2000000
@@ -64,6 +59,18 @@ commands through the serial port to the target device. It will receive and print
 the events received from the target device.
 
 Serial port is configured as 8N1, no flow control, default baud rate of """+str(defaultBaud)+""".
+
+Several devices can be given as a comma separated list of serial ports. Each
+job runs on the first free device, devices are locked with a lock file per port.
+
+If a broker socket is given with --broker or """+BROKER_ENV+""", the job is submitted
+to the broker (broker.py), which keeps the serial ports open.
+
+Use """+STDIO+""" as INPUT or OUTPUT to read from stdin or write to stdout, the console
+output then goes to stderr.
+
+The M command runs the jobs of a JSON or CSV manifest one after the other on the
+same device, with the options given on the command line.
 """
 
 # Parse the command line arguments
@@ -73,27 +80,101 @@ subparsers = parser.add_subparsers(dest='command')
 
 encode_parser = subparsers.add_parser("E", help="Encode")
 decode_parser = subparsers.add_parser("D", help="Decode")
+encdec_parser = subparsers.add_parser("ED", help="Encode and decode in the same session")
+manifest_parser = subparsers.add_parser("M", help="Run the jobs of a manifest")
 
-encode_parser.add_argument('INPUT', help='Input wav file')
-encode_parser.add_argument('OUTPUT', help='Output wav file')
+encode_parser.add_argument('INPUT', help='Input wav file, '+STDIO+' for stdin')
+encode_parser.add_argument('OUTPUT', help='Output bin file, '+STDIO+' for stdout')
 encode_parser.add_argument('BITRATE', help='Bitrate for encoding')
 encode_parser.add_argument('-fm', '--frame_ms', default="10", help="Frame duration in ms, must be 10 or 7.5, default 10")
 
-decode_parser.add_argument('INPUT', help='Input wav file')
-decode_parser.add_argument('OUTPUT', help='Output wav file')
+decode_parser.add_argument('INPUT', help='Input bin file, '+STDIO+' for stdin')
+decode_parser.add_argument('OUTPUT', help='Output wav file, '+STDIO+' for stdout')
+decode_parser.add_argument('--start', type=int, default=0,
+                           help='First frame to decode, default: 0')
+decode_parser.add_argument('--frames', type=int,
+                           help='Number of frames to decode, default: to the end of the file')
+decode_parser.add_argument('--prime', type=int, default=PRIME_FRAMES,
+                           help='Frames decoded and discarded before a segment to approximate the codec state, default: '
+                                +str(PRIME_FRAMES))
+decode_parser.add_argument('--segments', type=int, default=1,
+                           help='Split a mono file in segments decoded concurrently on free devices, default: 1')
+decode_parser.add_argument('--index', action='store_true',
+                           help='Save the frame offset index next to the input file and reuse it')
+
+encdec_parser.add_argument('INPUT', help='Input wav file, '+STDIO+' for stdin')
+encdec_parser.add_argument('BIN', help='Output bin file, '+STDIO+' for stdout')
+encdec_parser.add_argument('OUTPUT', help='Output wav file, '+STDIO+' for stdout')
+encdec_parser.add_argument('BITRATE', help='Bitrate for encoding')
+encdec_parser.add_argument('-fm', '--frame_ms', default="10", help="Frame duration in ms, must be 10 or 7.5, default 10")
+
+manifest_parser.add_argument('MANIFEST', help='JSON list or CSV file of jobs with the keys command, input, output,\n'
+                                             'bin, bitrate, frame_ms, log, start, frames, prime and segments')
 
 parser.add_argument('--serialPort', '-s', nargs='?',
-                    help='Serial port path or COM#')
+                    help='Serial port path or COM#, comma separated for several devices')
 parser.add_argument('--baud', '-b', nargs='?', default=defaultBaud,
                     help='Serial port baud rate, default: '+str(defaultBaud))
+parser.add_argument('--broker', nargs='?', default=os.environ.get(BROKER_ENV),
+                    help='Broker socket path, default: $'+BROKER_ENV)
+parser.add_argument('--window', '-w', type=int, default=1,
+                    help='Number of frames in flight, default: 1 (wait for each frame)')
+parser.add_argument('--profile', '-p', type=int, default=1,
+                    help='Query the execution time every N frames, 0 disables, default: 1 (every frame)')
+parser.add_argument('--framing', action='store_true',
+                    help="Use sequence numbered framing, lost events are retransmitted, the job fails if the device doesn't support it")
+parser.add_argument('--log', nargs='?',
+                    help='Write per-frame timing records to this file, CSV if it ends with .csv, binary otherwise.\n'
+                         'Per-frame execution time lines are then not printed')
+parser.add_argument('--resume', action='store_true',
+                    help='Save checkpoints next to the output and continue from the last one')
+parser.add_argument('--batch', type=int, default=1,
+                    help='Frames per command if the device supports batches, default: 1 (one frame per command)')
+parser.add_argument('--realtime', action='store_true',
+                    help='Send the frames at the frame interval and report the latency, deadline misses and jitter')
+parser.add_argument('--deadline', type=float,
+                    help='Real-time deadline of a frame in ms, default: the frame duration')
 
 args = parser.parse_args()
 
 if(args.command == None):
-    print("Must select either E or D")
+    print("Must select either E, D, ED or M")
     parser.print_help()
     exit(1)
 
+if(args.command == "M"):
+    # The command line options are shared by the jobs
+    try:
+        jobs = read_manifest(args.MANIFEST, {key: value for key, value in vars(args).items() if key != "MANIFEST"})
+    except (OSError, ValueError) as err:
+        print("Error reading manifest "+args.MANIFEST+": "+str(err))
+        sys.exit(1)
+else:
+    jobs = [vars(args)]
+
+    # Keep the console output out of the stream
+    streams = [args.INPUT, args.OUTPUT, getattr(args, "BIN", None)]
+    if(STDIO in streams[1:]):
+        console_to_stderr()
+
+    if(args.broker != None and STDIO in streams):
+        print("The standard input and output can't be used with the broker")
+        sys.exit(1)
+
+if(args.broker != None):
+    # Submit the jobs to the broker, it owns the serial ports
+    try:
+        retvals = [submit(args.broker, job) for job in jobs]
+        sys.exit(retvals[0] if args.command != "M" else int(any(retvals)))
+    except OSError as err:
+        print("Error connecting to broker "+args.broker+": "+str(err))
+        sys.exit(1)
+
+import serial
+from hci import HCI
+from job import run_job, run_jobs, job_devices
+from pool import DevicePool, parse_ports, open_serial
+
 if(args.serialPort == None):
     # Try and find an environment variable
     try:
@@ -103,63 +184,60 @@ if(args.serialPort == None):
         parser.print_help()
         exit(1)
 
-# Get the serial port lock to prevent UART interference 
-if(not os.path.exists(lockfileName)):
-    Path(lockfileName).touch()
-
-# Open the file
-lockfile = open(lockfileName, 'r+')
-
-# Write the PID to the file
-lockfile.truncate(0)
-lockfile.write(str(os.getpid())+"\n")
+# Get a free device, the lock prevents UART interference
+ports = parse_ports(args.serialPort)
+if(len(ports) == 0):
+    print("No serial port given")
+    exit(1)
 
-# Acquire the lock, blocking
-fcntl.lockf(lockfile, fcntl.LOCK_EX)
+pool = DevicePool(ports)
+serialPort, lockfile = pool.acquire()
 
 # Open the serial port
 try:
-    # Open serial port
-    port = serial.Serial(
-        port=str(args.serialPort),
-        baudrate=args.baud,
-        parity=serial.PARITY_NONE,
-        stopbits=serial.STOPBITS_ONE,
-        bytesize=serial.EIGHTBITS,
-        rtscts=False,
-        dsrdtr=False,
-        timeout=1.0
-    )
-    port.isOpen()
+    port = open_serial(serialPort, args.baud)
 except serial.SerialException as err:
     print(err)
 
     # Release the lock
-    fcntl.lockf(lockfile, fcntl.LOCK_UN)
-    lockfile.close()
+    pool.release(lockfile)
 
     sys.exit(1)
 
 hci = HCI(port)
 
+# Get more free devices for the channels of a multichannel item or the
+# segments of a segmented decode, the channels share the devices if there
+# aren't enough free ones
+devices = []
+extraPorts = []
+for extraPort, extraLockfile in pool.acquire_free(max([1] + [job_devices(job) for job in jobs]) - 1, [serialPort]):
+    try:
+        devices.append(HCI(open_serial(extraPort, args.baud)))
+        extraPorts.append((extraPort, extraLockfile))
+    except serial.SerialException as err:
+        print(err)
+        pool.release(extraLockfile)
+
 # Print the arguments
 print("LC3 UART tool")
 for arg in args.__dict__:
     if args.__dict__[arg] is not None:
         print(str(arg)+ ": "+str(args.__dict__[arg]))
+print("device: "+serialPort)
+for extraPort, extraLockfile in extraPorts:
+    print("device: "+extraPort)
 
-retval = 0
-
-if(args.command == "E"):
-    print("Encoding")
-    retval = Encoder.encode(hci, args.INPUT, args.OUTPUT, args.BITRATE, args.frame_ms)
-
+if(args.command == "M"):
+    retval = int(run_jobs(hci, jobs, devices) > 0)
 else:
-    print("Decoding")
-    retval = Decoder.decode(hci, args.INPUT, args.OUTPUT)
-
-# Release the lock
-fcntl.lockf(lockfile, fcntl.LOCK_UN)
-lockfile.close()
+    retval = run_job(hci, vars(args), devices)
+
+# Release the locks
+port.close()
+pool.release(lockfile)
+for device, (extraPort, extraLockfile) in zip(devices, extraPorts):
+    device.serial_port.close()
+    pool.release(extraLockfile)
 
 sys.exit(retval)
@@ -0,0 +1,293 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+## async_hci.py
+ #
+ # Host Controller Interface with an asyncio UART transport
+ #
+
+import asyncio
+import datetime
+import os
+from collections import deque
+from hci import CMD_DECODE, CMD_ENCODE, CMD_EXEC_TIME, CMD_INIT_DECODER, \
+    CMD_INIT_ENCODER, EVT_STATUS, INIT_STRUCT, MAX_TIMEOUT, decode_result, \
+    encode_result, event_length, exec_time_result, frame_duration_code, \
+    parse_event
+
+class AsyncHCI:
+
+    ## Create the transport.
+     #
+     # Must be created from a coroutine, the port file descriptor is switched
+     # to non-blocking mode and read by the running event loop.
+    ################################################################################
+    def __init__(self, serial_port, timeout=MAX_TIMEOUT):
+        self.serial_port = serial_port
+        self.fd = serial_port.fileno()
+        self.timeout = timeout
+        self.loop = asyncio.get_running_loop()
+
+        # Received bytes not yet parsed and bytes waiting to be sent
+        self.rx = bytearray()
+        self.tx = bytearray()
+
+        # Futures of the expected events, in the order the commands were sent
+        self.pending = deque()
+        self.watchdog = None
+
+        # Set while the input can be matched to the commands, cleared after a
+        # failure until the line has been idle
+        self.synced = asyncio.Event()
+        self.synced.set()
+        self.idle_timer = None
+
+        os.set_blocking(self.fd, False)
+        self.loop.add_reader(self.fd, self.on_readable)
+
+    ## Stop reading the port.
+     #
+     # Pending commands complete with None.
+    ################################################################################
+    def close(self):
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        self.fail()
+        self.on_idle()
+
+    ## Fail all pending commands.
+     #
+     # The controller handles commands in order, once an event is lost or
+     # garbled the rest of the stream can't be matched to its commands. The
+     # late events of the failed commands may still arrive, so the input is
+     # discarded until the line has been idle for the timeout, as HCI.drain
+     # does, and new commands wait for it.
+    ################################################################################
+    def fail(self):
+        pending, self.pending = self.pending, deque()
+        for future in pending:
+            if(not future.done()):
+                future.set_result(None)
+
+        self.rx.clear()
+        self.arm_watchdog()
+        self.synced.clear()
+        self.arm_idle_timer()
+
+    ## Restart the idle time of a resync.
+    ################################################################################
+    def arm_idle_timer(self):
+        if(self.idle_timer != None):
+            self.idle_timer.cancel()
+
+        self.idle_timer = self.loop.call_later(self.timeout, self.on_idle)
+
+    def on_idle(self):
+        if(self.idle_timer != None):
+            self.idle_timer.cancel()
+            self.idle_timer = None
+
+        self.synced.set()
+
+    ## Restart the response timeout.
+     #
+     # The timeout runs while commands are pending and restarts on every event,
+     # so it bounds the time between events rather than the time per command.
+    ################################################################################
+    def arm_watchdog(self):
+        if(self.watchdog != None):
+            self.watchdog.cancel()
+            self.watchdog = None
+
+        if(len(self.pending)):
+            self.watchdog = self.loop.call_later(self.timeout, self.on_timeout)
+
+    def on_timeout(self):
+        self.watchdog = None
+        print(str(datetime.datetime.now()) + " Error: no response, "+str(len(self.pending))+" events pending")
+        self.fail()
+
+    ## Read the available bytes and complete the pending commands.
+    ################################################################################
+    def on_readable(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError as err:
+            print(str(datetime.datetime.now()) + " Error: "+str(err))
+            self.fail()
+            return
+
+        # Discard the input of failed commands
+        if(not self.synced.is_set()):
+            self.arm_idle_timer()
+            return
+
+        self.rx += data
+
+        received = False
+        while(len(self.rx)):
+            packet_len = event_length(self.rx)
+            if(packet_len == 0):
+                print(str(datetime.datetime.now()) + "Error: unknown evt = "+str(self.rx[0]))
+                self.fail()
+                return
+
+            if(packet_len == None or len(self.rx) < packet_len):
+                break
+
+            status_evt = parse_event(bytes(self.rx[:packet_len]))
+            del self.rx[:packet_len]
+            received = True
+
+            if(len(self.pending) == 0):
+                print(str(datetime.datetime.now()) + "Error: unexpected evt = "+str(status_evt.evt))
+                continue
+
+            future = self.pending.popleft()
+            if(not future.done()):
+                future.set_result(status_evt)
+
+        if(received):
+            self.arm_watchdog()
+
+    ## Write to the port.
+     #
+     # Bytes the port doesn't accept right away are sent when it's writable.
+    ################################################################################
+    def write(self, data):
+        if(len(self.tx) == 0):
+            try:
+                sent = os.write(self.fd, data)
+            except BlockingIOError:
+                sent = 0
+            data = memoryview(data)[sent:]
+
+        if(len(data)):
+            if(len(self.tx) == 0):
+                self.loop.add_writer(self.fd, self.on_writable)
+            self.tx += data
+
+    def on_writable(self):
+        try:
+            sent = os.write(self.fd, self.tx)
+        except BlockingIOError:
+            return
+
+        del self.tx[:sent]
+        if(len(self.tx) == 0):
+            self.loop.remove_writer(self.fd)
+
+    ## Send a command.
+     #
+     # Queues the futures of the count events the packet produces. No await
+     # happens between writing the packet and queueing its futures, so
+     # concurrent commands are matched to their events in order. The callers
+     # wait for synced first.
+    ################################################################################
+    def submit(self, packet, count = 1):
+        futures = [self.loop.create_future() for i in range(count)]
+
+        start = len(self.pending) == 0
+        self.pending.extend(futures)
+        if(start):
+            self.arm_watchdog()
+
+        self.write(packet)
+        return futures
+
+    async def send_command(self, packet):
+        await self.synced.wait()
+        return (await self.submit(packet)[0])
+
+    async def exec_time(self):
+        return exec_time_result(await self.send_command(bytes([CMD_EXEC_TIME])))
+
+    async def init_encoder(self, frame_len, sample_rate, bitrate):
+        status_evt = await self.send_command(INIT_STRUCT.pack(CMD_INIT_ENCODER, frame_duration_code(frame_len), int(sample_rate), int(bitrate)))
+
+        if(status_evt == None or status_evt.evt != EVT_STATUS or status_evt.status != 0):
+            print("Error initializing encoder")
+            return False
+
+        return True
+
+    ## Encode a frame.
+     #
+     # The frame and execution time commands are sent together. Returns
+     # frameBytes, execTime like HCI.encode, or None, None on an error.
+    ################################################################################
+    async def encode(self, samples, exec_time = True):
+        events = await self.frame(CMD_ENCODE, samples, exec_time)
+
+        frameBytes = encode_result(events[0])
+        if(frameBytes == None):
+            return None, None
+
+        return frameBytes, exec_time_result(events[1]) if exec_time else None
+
+    async def init_decoder(self, frame_len, sample_rate, bitrate):
+        status_evt = await self.send_command(INIT_STRUCT.pack(CMD_INIT_DECODER, frame_duration_code(frame_len), int(sample_rate), int(bitrate)))
+
+        if(status_evt == None or status_evt.evt != EVT_STATUS or status_evt.status != 0):
+            print("Error initializing decoder")
+            return False
+
+        return True
+
+    ## Decode a frame.
+     #
+     # The frame and execution time commands are sent together. Returns
+     # frameSamples, execTime like HCI.decode, or None, None on an error.
+    ################################################################################
+    async def decode(self, data, exec_time = True):
+        events = await self.frame(CMD_DECODE, data, exec_time)
+
+        frameSamples = decode_result(events[0])
+        if(frameSamples == None):
+            return None, None
+
+        return frameSamples, exec_time_result(events[1]) if exec_time else None
+
+    async def frame(self, opcode, data, exec_time):
+        await self.synced.wait()
+        if(exec_time):
+            packet = bytes([opcode]) + data + bytes([CMD_EXEC_TIME])
+            return await asyncio.gather(*self.submit(packet, 2))
+
+        return [await self.submit(bytes([opcode]) + data)[0]]
+
+### ------------------------------------------------------------------------ ###
@@ -0,0 +1,261 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+## benchmark.py
+ #
+ # Throughput and latency benchmark of the UART transport
+ #
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from argparse import RawTextHelpFormatter
+from time import perf_counter, thread_time
+from bitstream import STDIO, console_to_stderr
+from hci import HCI
+from pool import open_serial
+from stats import summary
+
+# Setup the default serial port settings
+defaultBaud=2000000
+
+# Default bitrate for each sample rate, same operating points as the
+# conformance configurations
+BITRATES = {8000: 24000, 16000: 32000, 24000: 48000, 32000: 64000, 44100: 96000, 48000: 96000}
+
+# Upper edges of the latency histogram buckets in ms
+HISTOGRAM_EDGES = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+## Count values in the histogram buckets.
+ #
+ # Returns a list of [upper edge, count], the last bucket has no upper edge.
+################################################################################
+def histogram(values, edges = HISTOGRAM_EDGES):
+    counts = [0]*(len(edges)+1)
+    for value in values:
+        bucket = 0
+        while(bucket < len(edges) and value > edges[bucket]):
+            bucket += 1
+        counts[bucket] += 1
+
+    return [[edge, count] for edge, count in zip(edges + [None], counts)]
+
+## Run one benchmark case.
+ #
+ # Encodes or decodes frames of random data and measures the time between
+ # consecutive results. With a window of 1 this is the round trip latency of
+ # each frame. The host CPU time is the CPU time of this thread, the rest of
+ # the wall time is spent waiting for the wire and the device.
+################################################################################
+def run_case(hci, mode, sample_rate, frame_ms, bitrate, frames, window, profile, batch = 1):
+    frame_samples = int(sample_rate*frame_ms/1000)
+    frame_bytes = int(bitrate*frame_ms/8000)
+
+    if(mode == "encode"):
+        if(not hci.init_encoder(frame_ms, sample_rate, bitrate)):
+            return None
+        data = [os.urandom(frame_samples*2) for i in range(frames)]
+        results = hci.encode_frames(data, window, profile, batch)
+    else:
+        if(not hci.init_decoder(frame_ms, sample_rate, bitrate)):
+            return None
+        data = [os.urandom(frame_bytes) for i in range(frames)]
+        results = hci.decode_frames(data, window, profile, batch)
+
+    latencies = []
+    wall = perf_counter()
+    cpu = thread_time()
+    last = wall
+
+    for result, execTime in results:
+        if(result == None):
+            return None
+
+        now = perf_counter()
+        latencies.append((now - last)*1000)
+        last = now
+
+    wall = perf_counter() - wall
+    cpu = thread_time() - cpu
+    audio = frames*frame_ms/1000
+
+    return {
+        "mode":          mode,
+        "sample_rate":   sample_rate,
+        "frame_ms":      frame_ms,
+        "bitrate":       bitrate,
+        "frames":        frames,
+        "window":        window,
+        "profile":       profile,
+        "batch":         batch,
+        "wall_s":        wall,
+        "host_cpu_s":    cpu,
+        "wire_s":        max(wall - cpu, 0.0),
+        "fps":           frames/wall,
+        "rtf":           wall/audio,
+        "latency_ms":    summary(latencies),
+        "histogram_ms":  histogram(latencies),
+    }
+
+def print_case(result):
+    print("%-6s %6d Hz %4.1f ms %7d bps : %8.1f fps  RTF %.3f  host CPU %5.1f%%  p50 %.2f ms  p99 %.2f ms" % (
+        result["mode"], result["sample_rate"], result["frame_ms"], result["bitrate"], result["fps"],
+        result["rtf"], 100*result["host_cpu_s"]/result["wall_s"],
+        result["latency_ms"]["p50"], result["latency_ms"]["p99"]))
+
+## Start the emulator.
+ #
+ # Runs emulator.py in its own process so it doesn't share the interpreter
+ # with the host side being measured. Returns the process and its port.
+################################################################################
+def start_emulator(args):
+    args.emulator_dir = tempfile.mkdtemp()
+    link = os.path.join(args.emulator_dir, "lc3_emu")
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "emulator.py"),
+           "--link", link, "--latency", str(args.latency)]
+    if(args.emulator_baud != None):
+        cmd += ["--baud", str(args.emulator_baud)]
+    if(args.batch > 1):
+        cmd += ["--max-batch", str(args.batch)]
+    if(args.framing):
+        cmd += ["--framing"]
+    if(args.drop):
+        cmd += ["--drop", str(args.drop), "--corrupt", str(args.drop), "--garbage", str(args.drop)]
+
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    port = process.stdout.readline().strip()
+    return process, port
+
+def parse_list(text, type):
+    return [type(x) for x in text.split(",") if x.strip()]
+
+def main():
+    descText = """
+LC3 UART transport benchmark.
+
+Encodes and decodes random frames for each combination of mode, sample rate,
+frame duration and bitrate and reports frames per second, the real time factor
+(wall time / audio time, below 1 is faster than real time), the host CPU time
+and the latency between results. Runs against a serial port or the emulator.
+"""
+    parser = argparse.ArgumentParser(description=descText, formatter_class=RawTextHelpFormatter)
+    parser.add_argument('--serialPort', '-s', nargs='?',
+                        help='Serial port path or COM#, default: $LC3_SERIAL')
+    parser.add_argument('--baud', '-b', nargs='?', default=defaultBaud,
+                        help='Serial port baud rate, default: '+str(defaultBaud))
+    parser.add_argument('--emulator', action='store_true',
+                        help='Run against the emulator instead of a device')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Emulator latency before each event in seconds, default: 0')
+    parser.add_argument('--drop', type=float, default=0.0,
+                        help='Emulator probability of a dropped, corrupted or preceded by garbage event, default: 0')
+    parser.add_argument('--emulator-baud', type=int, default=None,
+                        help='Emulator UART pacing baud rate, default: no pacing')
+    parser.add_argument('--modes', default="encode,decode",
+                        help='Comma separated modes, default: encode,decode')
+    parser.add_argument('--rates', default=",".join(map(str, BITRATES)),
+                        help='Comma separated sample rates, default: all')
+    parser.add_argument('--frame-ms', default="10,7.5",
+                        help='Comma separated frame durations, default: 10,7.5')
+    parser.add_argument('--bitrates', default=None,
+                        help='Comma separated bitrates, default: one per sample rate')
+    parser.add_argument('--frames', type=int, default=200,
+                        help='Frames per case, default: 200')
+    parser.add_argument('--window', '-w', type=int, default=1,
+                        help='Number of frames in flight, default: 1')
+    parser.add_argument('--profile', '-p', type=int, default=0,
+                        help='Query the execution time every N frames, default: 0 (never)')
+    parser.add_argument('--batch', type=int, default=1,
+                        help='Frames per command if the device supports batches, default: 1')
+    parser.add_argument('--framing', action='store_true',
+                        help='Use sequence numbered framing')
+    parser.add_argument('--json', default=None,
+                        help='Write the results as JSON to this file, '+STDIO+' for stdout')
+    args = parser.parse_args()
+
+    # Keep the console output out of the JSON
+    stdout = sys.stdout
+    if(args.json == STDIO):
+        console_to_stderr()
+
+    emulator = None
+    if(args.emulator):
+        emulator, args.serialPort = start_emulator(args)
+    elif(args.serialPort == None):
+        args.serialPort = os.environ.get("LC3_SERIAL")
+
+    if(args.serialPort == None):
+        print("Must define LC3_SERIAL environment variable, specify with -s <serialPort> or use --emulator")
+        sys.exit(1)
+
+    hci = HCI(open_serial(args.serialPort, args.baud))
+
+    results = []
+    try:
+        if(args.framing and not hci.enable_framing()):
+            sys.exit(1)
+
+        for mode in args.modes.split(","):
+            for sample_rate in parse_list(args.rates, int):
+                for frame_ms in parse_list(args.frame_ms, float):
+                    bitrates = parse_list(args.bitrates, int) if args.bitrates else [BITRATES[sample_rate]]
+                    for bitrate in bitrates:
+                        result = run_case(hci, mode, sample_rate, frame_ms, bitrate, args.frames, args.window, args.profile, args.batch)
+                        if(result == None):
+                            print("Error in", mode, sample_rate, frame_ms, bitrate)
+                            continue
+                        print_case(result)
+                        results.append(result)
+    finally:
+        if(emulator != None):
+            emulator.terminate()
+            shutil.rmtree(args.emulator_dir, ignore_errors=True)
+
+    if(args.json != None):
+        text = json.dumps({"port": args.serialPort, "emulator": args.emulator, "results": results}, indent=1)
+        if(args.json == STDIO):
+            stdout.write(text + "\n")
+        else:
+            with open(args.json, "w") as jsonfile:
+                jsonfile.write(text)
+
+if __name__ == '__main__':
+    main()
+
+### ------------------------------------------------------------------------ ###
@@ -0,0 +1,333 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+
+## bitstream.py
+ #
+ # LC3 .bin bitstream files and stdin/stdout streams
+ #
+
+import os
+import sys
+import mmap
+import struct
+from array import array
+from collections import namedtuple
+
+# Path of the standard input or output
+STDIO = "-"
+
+# .bin file header, all fields are LSB first
+BIN_FILE_ID      = 0xcc1c
+BIN_HEADER       = struct.Struct("<HHHHHHHI")  # file ID, header length, sample rate/100,
+                                               # bitrate/100, channels, frame duration*100,
+                                               # RFU, signal length in samples
+
+# wav files written by the wave module have the samples after a 44 byte header
+WAV_HEADER       = struct.Struct("<4sI8sIHHIIHH4sI")  # RIFF, size, WAVEfmt, fmt size, format, channels,
+                                                     # rate, byte rate, block align, bits, data, size
+
+# Frame offset index sidecar file, a magic and the size, modification time and
+# number of frames of the .bin file, followed by the offsets
+INDEX_MAGIC      = b"LC3I"
+INDEX_HEADER     = struct.Struct("<QQI")    # file size, modification time in ns, number of frames
+INDEX_SUFFIX     = ".idx"
+
+## .bin file header.
+ #
+ # frameRate is the sample rate in Hz, bitRate in bps, frameLen in ms and
+ # signalLen in samples per channel.
+################################################################################
+BinHeader = namedtuple("BinHeader", ["headerLen", "frameRate", "bitRate", "channels", "frameLen", "signalLen"])
+
+## Read the .bin file header.
+ #
+ # The header is read at once, any header bytes beyond the known fields are
+ # skipped. Returns a BinHeader or None if the file ID is wrong.
+################################################################################
+def read_bin_header(input_bin):
+    data = input_bin.read(BIN_HEADER.size)
+    if(len(data) < BIN_HEADER.size):
+        return None
+
+    fileId, headerLen, frameRate, bitRate, channels, frameLen, rfu, signalLen = BIN_HEADER.unpack(data)
+    if(fileId != BIN_FILE_ID):
+        return None
+
+    if(headerLen > BIN_HEADER.size):
+        input_bin.read(headerLen - BIN_HEADER.size)
+
+    return BinHeader(headerLen, frameRate*100, bitRate*100, channels, frameLen/100, signalLen)
+
+## Write the .bin file header.
+################################################################################
+def write_bin_header(output_bin, frameRate, bitRate, channels, frameLen, signalLen):
+    output_bin.write(BIN_HEADER.pack(BIN_FILE_ID, BIN_HEADER.size, int(int(frameRate)/100),
+                                     int(int(bitRate)/100), channels, int(float(frameLen)*100),
+                                     0, signalLen & 0xFFFFFFFF))
+
+## Read the frames of a .bin file.
+ #
+ # Yields the bytes of each frame, without the length prefix.
+################################################################################
+def bin_frames(input_bin):
+    while(True):
+        # Read the number of bytes in the frame
+        frame = input_bin.read(2)
+
+        # See if we've reached EOF
+        if(len(frame) < 2):
+            break
+
+        # Convert to int and read the frame
+        frameBytes = int.from_bytes(frame, 'little')
+        yield input_bin.read(frameBytes)
+
+## Read the frames of a wav file.
+ #
+ # Yields frame_samples samples at a time, the last frame is padded with
+ # silence.
+################################################################################
+def wav_frames(input_wav, frame_samples):
+    frameBytes = frame_samples*input_wav.getnchannels()*input_wav.getsampwidth()
+    while(True):
+        frame = input_wav.readframes(frame_samples)
+        if(len(frame) == 0):
+            break
+        yield frame + bytes(frameBytes - len(frame))
+
+## Random access .bin file reader.
+ #
+ # The file is memory mapped and indexed with the offset of each frame, so any
+ # frame or range of frames is read without scanning the file. The frames of
+ # all channels are indexed, frame i of channel c is entry i*channels + c.
+ # With sidecar the index is loaded from and saved to a file next to the .bin
+ # file, it is rebuilt if the .bin file changed.
+################################################################################
+class BinReader:
+
+    def __init__(self, path, sidecar = False):
+        self.path = path
+        self.file = open(path, "rb")
+        self.header = read_bin_header(self.file)
+        if(self.header == None):
+            self.file.close()
+            raise ValueError("Not a bin file: "+str(path))
+
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.offsets = self.load_index() if sidecar else None
+        if(self.offsets == None):
+            self.offsets = self.build_index()
+            if(sidecar):
+                self.save_index()
+
+    ## Build the frame offset index.
+     #
+     # The offsets are the positions of the length prefix of each frame, the
+     # last entry is the end of the last complete frame.
+    ################################################################################
+    def build_index(self):
+        offsets = array("Q")
+        offset = self.header.headerLen
+        size = len(self.map)
+        while(offset + 2 <= size):
+            end = offset + 2 + int.from_bytes(self.map[offset:offset + 2], "little")
+            if(end > size):
+                break
+            offsets.append(offset)
+            offset = end
+        offsets.append(offset)
+        return offsets
+
+    ## Get the sidecar key of the .bin file.
+    ################################################################################
+    def index_key(self):
+        stat = os.fstat(self.file.fileno())
+        return stat.st_size, stat.st_mtime_ns
+
+    ## Load the sidecar index.
+     #
+     # Returns None if there is no index or it doesn't match the .bin file.
+    ################################################################################
+    def load_index(self):
+        try:
+            with open(str(self.path) + INDEX_SUFFIX, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        start = len(INDEX_MAGIC) + INDEX_HEADER.size
+        if(data[:len(INDEX_MAGIC)] != INDEX_MAGIC or len(data) < start):
+            return None
+
+        size, mtime, count = INDEX_HEADER.unpack_from(data, len(INDEX_MAGIC))
+        if((size, mtime) != self.index_key() or len(data) != start + (count + 1)*8):
+            return None
+
+        offsets = array("Q")
+        offsets.frombytes(data[start:])
+        if(sys.byteorder != "little"):
+            offsets.byteswap()
+        return offsets
+
+    ## Save the sidecar index.
+     #
+     # The index is an optimization, a read-only directory only costs the
+     # rebuild next time.
+    ################################################################################
+    def save_index(self):
+        offsets = array("Q", self.offsets)
+        if(sys.byteorder != "little"):
+            offsets.byteswap()
+
+        size, mtime = self.index_key()
+        try:
+            with open(str(self.path) + INDEX_SUFFIX, "wb") as f:
+                f.write(INDEX_MAGIC + INDEX_HEADER.pack(size, mtime, len(self.offsets) - 1))
+                f.write(offsets.tobytes())
+        except OSError as err:
+            print("Can't save the frame index: "+str(err))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    ## Get a frame.
+    ################################################################################
+    def frame(self, i):
+        if(i < 0):
+            i += len(self)
+        if(i < 0 or i >= len(self)):
+            raise IndexError("frame index out of range")
+
+        return self.map[self.offsets[i] + 2:self.offsets[i + 1]]
+
+    ## Yield the frames from start to stop.
+     #
+     # Same as slicing, stop is None for the end of the file.
+    ################################################################################
+    def frames(self, start = 0, stop = None):
+        for i in range(*slice(start, stop).indices(len(self))):
+            yield self.frame(i)
+
+    def __getitem__(self, key):
+        if(isinstance(key, slice)):
+            return [self.frame(i) for i in range(*key.indices(len(self)))]
+
+        return self.frame(key)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+## Open an input file.
+ #
+ # STDIO opens the standard input. The file is opened on a duplicate of the
+ # file descriptor, so closing it doesn't close the standard input.
+################################################################################
+def open_input(path):
+    if(path == STDIO):
+        return os.fdopen(os.dup(sys.stdin.fileno()), "rb")
+
+    return open(path, "rb")
+
+## Open an output file.
+ #
+ # STDIO opens the standard output, see console_to_stderr().
+################################################################################
+def open_output(path, mode = "wb"):
+    if(path == STDIO):
+        return os.fdopen(os.dup(sys.__stdout__.fileno()), "wb")
+
+    return open(path, mode)
+
+## wav file opened to append samples.
+ #
+ # The wave module can't append, the samples are written after the first
+ # length bytes of samples of the file and the sizes in the header are updated
+ # when the file is closed. Used like the writer of the wave module. Raises
+ # ValueError if the file wasn't written by the wave module with at least
+ # length bytes of samples.
+################################################################################
+class WavAppender:
+
+    def __init__(self, path, length):
+        self.file = open(path, "r+b")
+
+        data = self.file.read(WAV_HEADER.size)
+        fields = WAV_HEADER.unpack(data) if len(data) == WAV_HEADER.size else None
+        if(fields == None or fields[0] != b"RIFF" or fields[2] != b"WAVEfmt " or fields[10] != b"data" or
+           os.fstat(self.file.fileno()).st_size < WAV_HEADER.size + length):
+            self.file.close()
+            raise ValueError("Not a wav file with "+str(length)+" bytes of samples: "+str(path))
+
+        self.file.truncate(WAV_HEADER.size + length)
+        self.file.seek(0, os.SEEK_END)
+
+    def writeframesraw(self, data):
+        self.file.write(data)
+
+    def close(self):
+        if(self.file.closed):
+            return
+
+        size = self.file.tell()
+        self.file.seek(4)
+        self.file.write(struct.pack("<I", size - 8))
+        self.file.seek(WAV_HEADER.size - 4)
+        self.file.write(struct.pack("<I", size - WAV_HEADER.size))
+        self.file.close()
+
+## Check if a path is the standard input or output.
+################################################################################
+def is_stdio(path):
+    return path == STDIO
+
+## Send the console output to the standard error.
+ #
+ # Used when the output is written to the standard output, so the printed
+ # messages don't end up in the stream.
+################################################################################
+def console_to_stderr():
+    sys.stdout.flush()
+    sys.stdout = sys.stderr
+
+### ------------------------------------------------------------------------ ###
@@ -0,0 +1,252 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+## broker.py
+ #
+ # LC3 device broker. Keeps the serial ports open and runs the jobs submitted
+ # by LC3.py clients over a Unix domain socket.
+ #
+
+import argparse
+import io
+import json
+import os
+import serial
+import signal
+import socketserver
+import sys
+import threading
+import traceback
+from argparse import RawTextHelpFormatter
+from collections import OrderedDict, deque
+from broker_client import BROKER_ENV
+from hci import HCI
+from job import run_job
+from pool import DevicePool, parse_ports, open_serial
+
+# Setup the default serial port settings
+defaultBaud=2000000
+
+## Queue with round robin scheduling between clients.
+ #
+ # Each client has its own queue of jobs, get() takes the next job from the
+ # client that was served least recently. A conformance run that submits
+ # hundreds of jobs doesn't starve another run that submits a few.
+################################################################################
+class FairQueue:
+
+    def __init__(self):
+        self.queues = OrderedDict()
+        self.cond = threading.Condition()
+
+    def put(self, client, job):
+        with self.cond:
+            if(client not in self.queues):
+                self.queues[client] = deque()
+            self.queues[client].append(job)
+            self.cond.notify()
+
+    def get(self):
+        with self.cond:
+            while(len(self.queues) == 0):
+                self.cond.wait()
+
+            # Serve the first client and move it to the back of the rotation
+            client, queue = self.queues.popitem(last=False)
+            job = queue.popleft()
+            if(len(queue)):
+                self.queues[client] = queue
+
+            return job
+
+## Job submitted by a client.
+################################################################################
+class Job:
+
+    def __init__(self, args):
+        self.args = args
+        self.output = ""
+        self.retval = 1
+        self.done = threading.Event()
+
+## Standard output with per-thread capture.
+ #
+ # The encoder and decoder print their progress, each device thread captures
+ # the output of its job so it can be returned to the client.
+################################################################################
+class ThreadOutput:
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self, buffer):
+        self.local.buffer = buffer
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer if buffer != None else self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+## Device worker.
+ #
+ # Runs the queued jobs on one device until the broker exits.
+################################################################################
+def device_worker(port, hci, queue, output):
+    while(True):
+        job = queue.get()
+
+        buffer = io.StringIO()
+        output.capture(buffer)
+        try:
+            print("device: "+port)
+            job.retval = run_job(hci, job.args)
+        except Exception:
+            traceback.print_exc(file=buffer)
+            job.retval = 1
+        finally:
+            output.capture(None)
+
+        job.output = buffer.getvalue()
+        job.done.set()
+
+## Client connection handler.
+################################################################################
+class BrokerHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if(len(line) == 0):
+            return
+
+        try:
+            message = json.loads(line)
+            job = Job(message["job"])
+            client = message.get("client", "")
+        except (ValueError, KeyError, TypeError) as err:
+            self.reply({"output": "Invalid request: "+str(err)+"\n", "retval": 1})
+            return
+
+        self.server.queue.put(client, job)
+        job.done.wait()
+
+        self.reply({"output": job.output, "retval": job.retval})
+
+    def reply(self, message):
+        self.wfile.write(json.dumps(message).encode()+b"\n")
+
+class BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+## Stop the broker on SIGTERM.
+ #
+ # Exits from the main thread so the socket is removed and the locks are
+ # released, as on Ctrl-C.
+################################################################################
+def terminate(signum, frame):
+    sys.exit(0)
+
+def main():
+    descText = """
+LC3 device broker.
+
+Keeps the serial ports of one or more devices open and runs the encode and
+decode jobs submitted by LC3.py. Start the broker, then set """+BROKER_ENV+""" to the
+socket path so LC3.py submits its jobs instead of opening the serial port.
+Jobs from different clients are scheduled round robin.
+"""
+    parser = argparse.ArgumentParser(description=descText, formatter_class=RawTextHelpFormatter)
+    parser.add_argument('--serialPort', '-s', nargs='?',
+                        help='Serial port path or COM#, comma separated for several devices')
+    parser.add_argument('--baud', '-b', nargs='?', default=defaultBaud,
+                        help='Serial port baud rate, default: '+str(defaultBaud))
+    parser.add_argument('--socket', default=os.environ.get(BROKER_ENV, "lc3_broker.sock"),
+                        help='Unix domain socket path, default: $'+BROKER_ENV+' or lc3_broker.sock')
+    args = parser.parse_args()
+
+    if(args.serialPort == None):
+        args.serialPort = os.environ.get("LC3_SERIAL")
+    ports = parse_ports(args.serialPort or "")
+    if(len(ports) == 0):
+        print("Must define LC3_SERIAL environment variable or specify with -s <serialPort>")
+        parser.print_help()
+        sys.exit(1)
+
+    signal.signal(signal.SIGTERM, terminate)
+
+    # Lock the devices for the lifetime of the broker
+    pool = DevicePool(ports)
+    lockfiles = [pool.lock(port, blocking=True) for port in ports]
+
+    # Open the serial ports
+    try:
+        hcis = [HCI(open_serial(port, args.baud)) for port in ports]
+    except serial.SerialException as err:
+        print(err)
+        for lockfile in lockfiles:
+            pool.release(lockfile)
+        sys.exit(1)
+
+    output = ThreadOutput(sys.stdout)
+    sys.stdout = output
+
+    queue = FairQueue()
+    for port, hci in zip(ports, hcis):
+        threading.Thread(target=device_worker, args=(port, hci, queue, output), daemon=True).start()
+        print("Device ready: "+port)
+
+    if(os.path.exists(args.socket)):
+        os.unlink(args.socket)
+
+    server = BrokerServer(args.socket, BrokerHandler)
+    server.queue = queue
+    print("Broker listening on "+args.socket)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+        for lockfile in lockfiles:
+            pool.release(lockfile)
+
+if __name__ == '__main__':
+    main()
+
+### ------------------------------------------------------------------------ ###
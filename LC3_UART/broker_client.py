@@ -0,0 +1,103 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+## broker_client.py
+ #
+ # Client for the LC3 device broker. Only uses the standard library so it
+ # starts quickly.
+ #
+
+import json
+import os
+import socket
+
+# Environment variable with the path of the broker socket
+BROKER_ENV = "LC3_BROKER"
+
+# Environment variable with the client name used for fair queueing
+CLIENT_ENV = "LC3_CLIENT"
+
+## Get the client name.
+ #
+ # Defaults to the parent process ID, so all jobs started by one conformance
+ # run share a queue in the broker.
+################################################################################
+def client_name():
+    return os.environ.get(CLIENT_ENV, str(os.getppid()))
+
+## Make the file arguments of a job absolute.
+ #
+ # The broker runs in a different working directory. A bitrate that names an
+ # existing file (a bitrate switching file) is made absolute as well.
+################################################################################
+def absolute_paths(job):
+    job = dict(job)
+    for key in ["INPUT", "BIN", "OUTPUT", "log"]:
+        if(job.get(key) != None):
+            job[key] = os.path.abspath(job[key])
+
+    if(job.get("BITRATE") != None and os.path.isfile(job["BITRATE"])):
+        job["BITRATE"] = os.path.abspath(job["BITRATE"])
+
+    return job
+
+## Send a request to the broker.
+ #
+ # Requests and responses are one line of JSON each. Returns the response.
+################################################################################
+def request(path, message):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(message).encode()+b"\n")
+        response = sock.makefile("rb").readline()
+    finally:
+        sock.close()
+
+    if(len(response) == 0):
+        return {"output": "Broker closed the connection\n", "retval": 1}
+
+    return json.loads(response)
+
+## Submit a job to the broker.
+ #
+ # Waits for the job to finish, prints its output and returns its exit code.
+################################################################################
+def submit(path, job):
+    response = request(path, {"client": client_name(), "job": absolute_paths(job)})
+    print(response["output"], end="")
+    return response["retval"]
+
+### ------------------------------------------------------------------------ ###
@@ -0,0 +1,224 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+
+## channels.py
+ #
+ # Multichannel items, each channel runs on its own codec instance
+ #
+
+import threading
+from queue import Queue, Empty, Full
+
+# Frames queued per channel when the channels run concurrently
+QUEUE_FRAMES = 64
+
+# Interval to check for a stop request while waiting on a queue
+STOP_POLL = 0.1
+
+## Split interleaved 16 bit samples into channels.
+ #
+ # Returns a list with the samples of each channel.
+################################################################################
+def split_channels(frame, nchannels):
+    if(nchannels == 1):
+        return [frame]
+
+    samples = memoryview(frame).cast("h")
+    return [samples[c::nchannels].tobytes() for c in range(nchannels)]
+
+## Interleave the 16 bit samples of the channels.
+################################################################################
+def interleave_channels(frames):
+    if(len(frames) == 1):
+        return frames[0]
+
+    data = bytearray(sum(len(frame) for frame in frames))
+    samples = memoryview(data).cast("h")
+    for c, frame in enumerate(frames):
+        samples[c::len(frames)] = memoryview(frame).cast("B").cast("h")
+
+    return data
+
+## Group consecutive frames.
+ #
+ # The .bin file has the frames of all channels for each frame in channel
+ # order. Yields a list of count frames.
+################################################################################
+def group_frames(frames, count):
+    group = []
+    for frame in frames:
+        group.append(frame)
+        if(len(group) == count):
+            yield group
+            group = []
+
+## Read a channel from its queue.
+################################################################################
+def queue_frames(queue, stop):
+    while(not stop.is_set()):
+        try:
+            frame = queue.get(timeout=STOP_POLL)
+        except Empty:
+            continue
+
+        if(frame == None):
+            return
+        yield frame
+
+## Put to a queue unless stopped.
+ #
+ # Returns False if stopped.
+################################################################################
+def queue_put(queue, item, stop):
+    while(not stop.is_set()):
+        try:
+            queue.put(item, timeout=STOP_POLL)
+            return True
+        except Full:
+            continue
+
+    return False
+
+## Run the channels of an item.
+ #
+ # frames yields a list with the frame of each channel. run(hci, channel,
+ # frames) yields result, execTime for each frame of a channel. Each channel
+ # needs its own codec state, so channel c runs on device c modulo the number
+ # of devices and run must initialize the codec again for channels after the
+ # first one on a device. Channels on different devices run
+ # concurrently, channels sharing a device run one after the other and the
+ # frames of the later ones are queued meanwhile.
+ #
+ # Yields a list of result, execTime, roundTrip per channel for each frame, the
+ # result is None on an error and the generator stops after it.
+################################################################################
+def run_channels(hcis, nchannels, frames, run):
+    if(nchannels == 1):
+        for result, execTime in run(hcis[0], 0, (frame[0] for frame in frames)):
+            yield [(result, execTime, hcis[0].round_trip)]
+            if(result == None):
+                return
+        return
+
+    # Bound the queues only if every channel has its own device, otherwise the
+    # reader would wait for channels that haven't started
+    hcis = hcis[:nchannels]
+    size = QUEUE_FRAMES if len(hcis) == nchannels else 0
+    inputs = [Queue(size) for c in range(nchannels)]
+    outputs = [Queue() for c in range(nchannels)]
+    stop = threading.Event()
+
+    def reader():
+        for frame in frames:
+            for c in range(nchannels):
+                if(not queue_put(inputs[c], frame[c], stop)):
+                    return
+
+        for c in range(nchannels):
+            queue_put(inputs[c], None, stop)
+
+    def worker(hci, channels):
+        for c in channels:
+            for result, execTime in run(hci, c, queue_frames(inputs[c], stop)):
+                outputs[c].put((result, execTime, hci.round_trip))
+                if(result == None):
+                    break
+            outputs[c].put(None)
+
+    threads = [threading.Thread(target=reader, daemon=True)]
+    for d, hci in enumerate(hcis):
+        threads.append(threading.Thread(target=worker, args=(hci, range(d, nchannels, len(hcis))), daemon=True))
+
+    for thread in threads:
+        thread.start()
+
+    try:
+        while(True):
+            row = [outputs[c].get() for c in range(nchannels)]
+            if(all(result == None for result in row)):
+                return
+
+            # A channel ended early
+            row = [(None, None, None) if result == None else result for result in row]
+            yield row
+            if(any(result[0] == None for result in row)):
+                return
+    finally:
+        stop.set()
+
+## Run segments of a channel.
+ #
+ # segments is a list of skip, frames pairs, segment s runs on device s. The
+ # codec state at the start of a segment is rebuilt by decoding the frames
+ # before it, run(hci, segment, frames) yields result, execTime for each
+ # frame and the first skip results are discarded. The segments run
+ # concurrently, the results of the later ones are queued meanwhile.
+ #
+ # Yields result, execTime, roundTrip for each frame in segment order, the
+ # result is None on an error and the generator stops after it.
+################################################################################
+def run_segments(hcis, segments, run):
+    outputs = [Queue() for s in segments]
+    stop = threading.Event()
+
+    def worker(hci, segment):
+        skip, frames = segments[segment]
+        for index, (result, execTime) in enumerate(run(hci, segment, frames)):
+            if(stop.is_set()):
+                return
+            if(index >= skip or result == None):
+                outputs[segment].put((result, execTime, hci.round_trip))
+            if(result == None):
+                break
+        outputs[segment].put(None)
+
+    threads = [threading.Thread(target=worker, args=(hci, s), daemon=True) for s, hci in enumerate(hcis[:len(segments)])]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for output in outputs:
+            while(True):
+                result = output.get()
+                if(result == None):
+                    break
+                yield result
+                if(result[0] == None):
+                    return
+    finally:
+        stop.set()
+
+### ------------------------------------------------------------------------ ###
@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+
+## checkpoint.py
+ #
+ # Checkpoints to resume long encoder and decoder jobs
+ #
+
+import os
+import json
+
+# Number of frames between checkpoints
+CHECKPOINT_FRAMES = 100
+
+# Number of frames decoded before the start of a partial or segmented decode
+# to approximate the codec state, their results are discarded. A resumed job
+# decodes or encodes all the frames before the checkpoint instead, the codec
+# state doesn't settle in a fixed number of frames.
+PRIME_FRAMES = 4
+
+## Get the checkpoint path of an output file.
+################################################################################
+def checkpoint_path(output):
+    return str(output) + ".ckpt"
+
+## Describe a job for its checkpoint.
+ #
+ # A checkpoint is only used by a job with the same input file, unchanged
+ # since the checkpoint, and the same codec parameters.
+################################################################################
+def job_key(command, input, params):
+    stat = os.stat(input)
+    return {
+        "command": command,
+        "input":   os.path.abspath(input),
+        "size":    stat.st_size,
+        "mtime":   stat.st_mtime,
+        "params":  params,
+    }
+
+## Load a checkpoint.
+ #
+ # Returns frame, length for the first frame to process and the number of
+ # bytes of the output written before it, or 0, 0 if there is no checkpoint
+ # for this job.
+################################################################################
+def load_checkpoint(output, key):
+    try:
+        with open(checkpoint_path(output), "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return 0, 0
+
+    if(state.get("key") != key):
+        print("Checkpoint doesn't match the job, starting over")
+        return 0, 0
+
+    return state["frame"], state["length"]
+
+## Save a checkpoint.
+ #
+ # The output must be flushed first. The checkpoint is replaced atomically,
+ # so a failure while saving leaves the previous one.
+################################################################################
+def save_checkpoint(output, key, frame, length):
+    path = checkpoint_path(output)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"key": key, "frame": frame, "length": length}, f)
+    os.replace(path + ".tmp", path)
+
+## Remove the checkpoint of a completed job.
+################################################################################
+def remove_checkpoint(output):
+    try:
+        os.remove(checkpoint_path(output))
+    except FileNotFoundError:
+        pass
+
+### ------------------------------------------------------------------------ ###
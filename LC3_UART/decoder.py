@@ -40,6 +40,16 @@
 
 import wave
 from hci import HCI
+from stats import print_summary, print_rtf
+from framelog import FrameLog
+from time import perf_counter
+from checkpoint import CHECKPOINT_FRAMES, PRIME_FRAMES, job_key, load_checkpoint, \
+    save_checkpoint, remove_checkpoint
+from bitstream import BIN_FILE_ID, WAV_HEADER, BinReader, WavAppender, bin_frames, is_stdio, \
+    open_input, open_output, read_bin_header
+from channels import group_frames, interleave_channels, run_channels, run_segments
+from realtime import Pacer
+from itertools import islice
 import os
 
 def chunks(lst, n):
@@ -52,80 +62,231 @@ class Decoder:
     def __init__(self):
         pass
 
-    def decode(hci, input, output):
+    ## Decode a bin file.
+     #
+     # devices are more HCIs for the channels of a multichannel file, the
+     # channels run concurrently on different devices.
+     #
+     # segment is a start, stop pair of frames to decode only part of the file,
+     # stop is None for the end of the file. The codec state at the start is
+     # approximated by decoding prime_frames frames before it. A mono file can be
+     # split in segments decoded concurrently on the devices. index saves the
+     # frame offset index next to the input for the next random access.
+     # realtime sends the frames at the frame interval and counts the results
+     # later than deadline ms, one frame interval by default.
+    ################################################################################
+    def decode(hci, input, output, window=1, profile=1, batch=1, resume=False, log=None, devices=[],
+               segment=None, prime_frames=PRIME_FRAMES, segments=1, index=False, realtime=False, deadline=None):
         print("\nDecoder")
 
         # Setup the output bin file
-        input_bin = open(input, 'rb')
+        input_bin = open_input(input)
+        output_file = output_wav = reader = frameLog = None
+        try:
+            # Parse the header
+            header = read_bin_header(input_bin)
+            if(header == None):
+                print("Error decoding input bin")
+                return 1
+            headerLen, frameRate, bitRate, channels, frameLen, signalLen = header
 
-        # Check the file ID
-        fileId = input_bin.read(2)
-        fileId = int.from_bytes(fileId, 'little')
-        if(fileId != 0xcc1c):
-            print("Error decoding input bin")
-            return 1
-        print("fileId: ",hex(fileId))
+            print("fileId: ",hex(BIN_FILE_ID))
+            print("headerLen: ", hex(headerLen))
+            print("frameRate: ", frameRate)
+            print("bitRate: ", bitRate)
+            print("channels: ", channels)
+            print("frameLen: ", frameLen)
+            print("signalLen: ", signalLen)
 
-        headerLen = input_bin.read(2)
-        headerLen = int.from_bytes(headerLen, 'little')
-        print("headerLen: ", hex(headerLen))
+            if(channels < 1):
+                print("Error decoding input bin")
+                return 1
 
-        frameRate = input_bin.read(2)
-        frameRate = int.from_bytes(frameRate, 'little')*100
-        print("frameRate: ", frameRate)
+            first, last = segment if segment != None else (0, None)
+            if(segments > 1 and (channels > 1 or is_stdio(input) or realtime)):
+                print("Segments need a mono input file and no real-time pacing, decoding in one segment")
+                segments = 1
 
-        bitRate = input_bin.read(2)
-        bitRate = int.from_bytes(bitRate, 'little')*100
-        print("bitRate: ", bitRate)
+            # One device per channel or segment at most
+            hcis = ([hci] + list(devices))[:max(channels, segments)]
+            segments = min(segments, len(hcis))
+            print("devices: ", len(hcis))
 
-        channels = input_bin.read(2)
-        channels = int.from_bytes(channels, 'little')
-        print("channels: ", channels)
+            # Continue after the last checkpoint of a previous run. The device can't
+            # save the codec state and it doesn't settle in a fixed number of
+            # frames, all the frames before the checkpoint are decoded again to
+            # rebuild it and their results are discarded.
+            if(resume and (is_stdio(input) or is_stdio(output))):
+                print("Can't resume with the standard input or output")
+                resume = False
+            if(resume and (segment != None or segments > 1)):
+                print("Can't resume a segmented decode")
+                resume = False
+            key = job_key("D", input, []) if resume else None
+            start, length = load_checkpoint(output, key) if resume else (first, 0)
+            if(resume and start):
+                try:
+                    with wave.open(output, 'rb') as previous_wav:
+                        written = previous_wav.getnframes()*channels*2 if previous_wav.getnchannels() == channels else 0
+                    written = min(written, os.path.getsize(output) - WAV_HEADER.size)
+                except (OSError, EOFError, wave.Error):
+                    written = 0
 
-        frameLen = input_bin.read(2)
-        frameLen = int.from_bytes(frameLen, 'little')/100
-        print("frameLen: ", frameLen)
+                if(written < length):
+                    print("Output doesn't match the checkpoint, starting over")
+                    start, length = 0, 0
+            prime = start if resume else min(start, prime_frames)
 
-        rfu = input_bin.read(2)
+            # Seek to and count the frames with the frame offset index, a stream
+            # is read from the start
+            reader = None
+            if(not is_stdio(input)):
+                reader = BinReader(input, index)
+                print("frames: ", len(reader)//channels)
 
-        signalLen = input_bin.read(4)
-        signalLen = int.from_bytes(signalLen, 'little')
-        print("signalLen: ", signalLen)
+            # Get the frames from begin to end, a list with the frame of each channel
+            def read_frames(begin, end):
+                stop = end*channels if end != None else None
+                if(reader != None):
+                    return group_frames(reader.frames(begin*channels, stop), channels)
+                return group_frames(islice(bin_frames(input_bin), begin*channels, stop), channels)
 
-        # Send the command to initialize the decoder
-        if(not hci.init_decoder(frameLen, frameRate, bitRate)):
-            return 1
+            # Send the command to initialize the decoder of the first channel of
+            # each device, the bitrate is shared by the channels
+            channelBitrate = bitRate//channels
+            for device in hcis:
+                if(not device.init_decoder(frameLen, frameRate, channelBitrate)):
+                    return 1
 
-        # Setup the wav file
-        output_wav = wave.open(output,'wb')
+            def run(device, channel, channelFrames):
+                if(channel >= len(hcis) and not device.init_decoder(frameLen, frameRate, channelBitrate)):
+                    yield None, None
+                    return
 
-        output_wav.setnchannels(channels)
-        output_wav.setsampwidth(2)
-        output_wav.setframerate(frameRate)
-        output_wav.setnframes(signalLen)
+                # The priming frames aren't profiled
+                channelFrames = iter(channelFrames)
+                if(prime):
+                    yield from device.decode_frames(islice(channelFrames, prime), window, 0, batch)
+                perCommand = device.frames_per_command(batch)
+                yield from device.decode_frames(channelFrames, window, profile, batch, (prime + perCommand - 1)//perCommand)
 
-        # Decode each frame
-        while(True):
-            # Read the number of bytes in the frame
-            frame = input_bin.read(2)
+            # Setup the wav file, it has the samples of every decoded frame. A
+            # stream can't be counted, it has the frames of the signal length
+            # of the header. The header can't be updated on a pipe, so the
+            # length is set first and the samples are trimmed or padded to it,
+            # whatever the output.
+            frameSamples = int(frameRate*frameLen/1000)
+            total = len(reader)//channels if reader != None else -(-signalLen//frameSamples)
+            nframes = max((total if last == None else min(last, total)) - first, 0)*frameSamples
+            if(resume and start):
+                # Keep the samples written before the checkpoint
+                print("Resuming at frame", start, "after decoding the frames before it again")
+                output_wav = WavAppender(output, length)
+                output_file = output_wav.file
+            else:
+                output_file = open_output(output)
+                output_wav = wave.open(output_file,'wb')
+                output_wav.setnchannels(channels)
+                output_wav.setsampwidth(2)
+                output_wav.setframerate(frameRate)
+                output_wav.setnframes(nframes)
+            remaining = nframes*channels*2 - length
 
-            # See if we've reached EOF
-            if(len(frame) < 2):
-                break
+            if(segment != None):
+                print("Decoding frames", first, "to", "the end" if last == None else last, "after",
+                      prime, "priming frames")
 
-            # Convert to int
-            frameBytes = int.from_bytes(frame, 'little')
+            # Decode each frame and write to the wave file
+            execTimes = []
+            frameLog = FrameLog(log)
+            count = 0
+            pacer = Pacer(frameLen, deadline) if realtime else None
+            wall = perf_counter()
+            if(segments > 1):
+                # Split the frames evenly, each segment is primed with the frames
+                # before it
+                stop = len(reader) if last == None else min(last, len(reader))
+                bounds = [start + (stop - start)*s//segments for s in range(segments + 1)]
+                print("Decoding", segments, "segments from frames", bounds[:-1])
+                parts = []
+                for begin, end in zip(bounds, bounds[1:]):
+                    skip = min(begin, prime_frames)
+                    parts.append((skip, (frame[0] for frame in read_frames(begin - skip, end))))
+                results = ([result] for result in run_segments(hcis, parts, run))
+                prime = 0
+            else:
+                # The frames of the channels follow each other in the bin file
+                frames = read_frames(start - prime, last)
+                if(pacer != None):
+                    frames = pacer.pace(frames)
+                results = run_channels(hcis, channels, frames, run)
 
-            # Read the frame, decode and write to the wave file
-            frameData = input_bin.read(frameBytes)
-            decodedSamples, execTime = hci.decode(frameData)
-            output_wav.writeframes(decodedSamples)
+            for index, channelResults in enumerate(results, start - prime):
 
-            print(os.path.basename(input),",",frameRate,",",bitRate,",",execTime,", decode")
+                if(any(decodedSamples == None for decodedSamples, execTime, roundTrip in channelResults)):
+                    print("Error decoding frame")
+                    if(resume):
+                        output_file.flush()
+                        save_checkpoint(output, key, max(index, start), length)
+                    return 1
 
-        
-        output_wav.close()
+                latency = pacer.result() if pacer != None else None
 
-        return 0
+                # Discard the priming frames
+                if(index < start):
+                    continue
+
+                for decodedSamples, execTime, roundTrip in channelResults:
+                    frameLog.record(index, len(decodedSamples), execTime, roundTrip, latency)
+
+                    if(execTime != None):
+                        execTimes.append(execTime)
+                        if(log == None):
+                            print(os.path.basename(input),",",frameRate,",",bitRate,",",execTime,", decode")
+
+                decodedSamples = interleave_channels([result[0] for result in channelResults])[:remaining]
+                remaining -= len(decodedSamples)
+
+                # The header is updated once when the file is closed
+                output_wav.writeframesraw(decodedSamples)
+                length += len(decodedSamples)
+                count += 1
+
+                if(resume and (index + 1) % CHECKPOINT_FRAMES == 0):
+                    output_file.flush()
+                    save_checkpoint(output, key, index + 1, length)
+
+
+            if(remaining):
+                output_wav.writeframesraw(bytes(remaining))
+
+            output_wav.close()
+            wall = perf_counter() - wall
+
+            if(resume):
+                remove_checkpoint(output)
+
+            if(profile > 0):
+                print_summary("\nDecode execution time", execTimes, "cycles")
+            print_summary("\nDecode round trip", frameLog.roundTrips, "ms")
+            print_rtf("\nDecode real time factor", count, wall, count*frameLen/1000)
+            if(pacer != None):
+                pacer.print_summary("\nDecode real-time latency")
+
+            return 0
+        finally:
+            # The wav header can't be updated on a pipe after an error
+            if(output_wav != None):
+                try:
+                    output_wav.close()
+                except OSError:
+                    pass
+            if(output_file != None):
+                output_file.close()
+            if(reader != None):
+                reader.close()
+            if(frameLog != None):
+                frameLog.close()
+            input_bin.close()
 
 ### ------------------------------------------------------------------------ ###
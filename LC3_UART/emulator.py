@@ -0,0 +1,555 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+## emulator.py
+ #
+ # LC3 controller emulator on a pseudo-terminal. Implements the UART protocol
+ # so the host tools can be run and measured without a device.
+ #
+
+import argparse
+import importlib
+import inspect
+import os
+import pty
+import random
+import sys
+import threading
+import tty
+from argparse import RawTextHelpFormatter
+from collections import OrderedDict
+from time import perf_counter, sleep
+from hci import CMD_BATCH_DECODE, CMD_BATCH_ENCODE, CMD_CAPABILITIES, \
+    CMD_DECODE, CMD_ENCODE, CMD_EXEC_TIME, CMD_INIT_DECODER, CMD_INIT_ENCODER, \
+    EVT_BATCH_DECODE, EVT_BATCH_ENCODE, EVT_CAPABILITIES, EVT_DECODE, \
+    EVT_ENCODE, EVT_EXEC_TIME, EVT_STATUS, BATCH_DECODE_STRUCT, \
+    BATCH_ENCODE_STRUCT, BATCH_RESULT_STRUCT, CAPS_STRUCT, EXEC_TIME_STRUCT, \
+    FRAME_SYNC, FRAMING_VERSION, INIT_STRUCT, LENGTH_STRUCT, RESULT_STRUCT, \
+    frame_duration_ms, frame_packet, unframe
+
+## Backend producing silence.
+ #
+ # Encodes every frame to zero bytes of the size given by the bitrate and
+ # decodes every frame to silence. Costs no CPU, so measurements only show the
+ # host and the transport.
+################################################################################
+class NullBackend:
+
+    def init_encoder(self, frame_len, sample_rate, bitrate):
+        self.frame_bytes = int(bitrate*frame_duration_ms(frame_len)/8000)
+
+    def encode(self, samples):
+        return bytes(self.frame_bytes)
+
+    def init_decoder(self, frame_len, sample_rate, bitrate):
+        self.frame_samples = int(sample_rate*frame_duration_ms(frame_len)/1000)
+
+    def decode(self, data):
+        return bytes(self.frame_samples*2)
+
+## Backend using liblc3.
+ #
+ # Requires the lc3 Python module of liblc3. The module of liblc3 1.0 takes the
+ # frame duration in ms, lc3py 1.1 and later in us.
+################################################################################
+class Liblc3Backend:
+
+    def __init__(self):
+        import lc3
+        self.lc3 = lc3
+        self.us = "frame_duration_us" in inspect.signature(lc3.Encoder).parameters
+
+    def frame_duration(self, frame_len):
+        return int(frame_duration_ms(frame_len)*1000) if self.us else frame_duration_ms(frame_len)
+
+    def init_encoder(self, frame_len, sample_rate, bitrate):
+        self.frame_bytes = int(bitrate*frame_duration_ms(frame_len)/8000)
+        self.encoder = self.lc3.Encoder(self.frame_duration(frame_len), sample_rate)
+
+    def encode(self, samples):
+        return bytes(self.encoder.encode(samples, self.frame_bytes, bit_depth=16))
+
+    def init_decoder(self, frame_len, sample_rate, bitrate):
+        self.decoder = self.lc3.Decoder(self.frame_duration(frame_len), sample_rate)
+
+    def decode(self, data):
+        return bytes(self.decoder.decode(data, bit_depth=16))
+
+## Backend with a single codec instance.
+ #
+ # Wraps another backend like a device that keeps either an encoder or a
+ # decoder, initializing one replaces the other and using the replaced one
+ # fails.
+################################################################################
+class SingleInstanceBackend:
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.codec = None
+
+    def init_encoder(self, frame_len, sample_rate, bitrate):
+        self.codec = "encoder"
+        self.backend.init_encoder(frame_len, sample_rate, bitrate)
+
+    def encode(self, samples):
+        if(self.codec != "encoder"):
+            raise RuntimeError("the codec instance isn't an encoder")
+        return self.backend.encode(samples)
+
+    def init_decoder(self, frame_len, sample_rate, bitrate):
+        self.codec = "decoder"
+        self.backend.init_decoder(frame_len, sample_rate, bitrate)
+
+    def decode(self, data):
+        if(self.codec != "decoder"):
+            raise RuntimeError("the codec instance isn't a decoder")
+        return self.backend.decode(data)
+
+BACKENDS = {"null": NullBackend, "liblc3": Liblc3Backend}
+
+## Load a backend.
+ #
+ # name is one of BACKENDS or module:Class for a custom backend.
+################################################################################
+def load_backend(name):
+    if(name in BACKENDS):
+        return BACKENDS[name]()
+
+    module, cls = name.split(":")
+    return getattr(importlib.import_module(module), cls)()
+
+class Emulator:
+
+    ## Create the emulator.
+     #
+     # latency is added before every event in seconds. baud paces the commands
+     # and events as if they were sent over a UART, None disables the pacing.
+     # drop is the probability an event is not sent, corrupt the probability a
+     # byte of an event is changed and garbage the probability an unknown event
+     # byte is sent before an event. max_batch is the maximum number of frames
+     # per batch command, 0 emulates a device without the batch commands.
+     # framing enables the sequence numbered framing.
+    ################################################################################
+    def __init__(self, backend, latency = 0.0, baud = None, drop = 0.0, corrupt = 0.0, garbage = 0.0, seed = None,
+                 max_batch = 0, framing = False):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.framing = framing
+        self.latency = latency
+        self.baud = baud
+        self.drop = drop
+        self.corrupt = corrupt
+        self.garbage = garbage
+        self.random = random.Random(seed)
+
+        self.rx = bytearray()
+        self.frame_samples = 0
+        self.frame_bytes = 0
+        self.execTime = 0
+
+        # Framing state, the next sequence number to handle, None before the
+        # first framed capabilities command, the commands received ahead of it
+        # and the events sent for the last commands
+        self.expected = None
+        self.held = {}
+        self.sent = OrderedDict()
+        self.seq = None
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+
+    ## Get the serial port path of the emulator.
+    ################################################################################
+    def port(self):
+        return os.ttyname(self.slave)
+
+    ## Serve commands in a daemon thread.
+     #
+     # Returns the serial port path.
+    ################################################################################
+    def start(self):
+        threading.Thread(target=self.serve, daemon=True).start()
+        return self.port()
+
+    ## Serve commands until the pty is closed.
+    ################################################################################
+    def serve(self):
+        while(True):
+            try:
+                data = os.read(self.master, 65536)
+            except OSError:
+                return
+
+            if(len(data) == 0):
+                return
+
+            self.rx += data
+            while(self.handle()):
+                pass
+
+    ## Pace a transfer.
+     #
+     # A UART sends 10 bits per byte with 8N1.
+    ################################################################################
+    def pace(self, count):
+        if(self.baud != None):
+            sleep(count*10/self.baud)
+
+    ## Get the length of the next command.
+     #
+     # Returns None if more data is needed.
+    ################################################################################
+    def command_length(self):
+        opcode = self.rx[0]
+
+        if(opcode == CMD_INIT_ENCODER or opcode == CMD_INIT_DECODER):
+            return INIT_STRUCT.size
+
+        if(opcode == CMD_ENCODE):
+            return 1 + self.frame_samples*2
+
+        if(opcode == CMD_DECODE):
+            return 1 + self.frame_bytes
+
+        if(self.max_batch and opcode == CMD_BATCH_ENCODE):
+            if(len(self.rx) < BATCH_ENCODE_STRUCT.size):
+                return None
+            opcode, count, samples = BATCH_ENCODE_STRUCT.unpack_from(self.rx)
+            return BATCH_ENCODE_STRUCT.size + count*samples*2
+
+        if(self.max_batch and opcode == CMD_BATCH_DECODE):
+            if(len(self.rx) < BATCH_DECODE_STRUCT.size):
+                return None
+            opcode, count = BATCH_DECODE_STRUCT.unpack_from(self.rx)
+
+            # Walk the length-prefixed frames
+            length = BATCH_DECODE_STRUCT.size
+            for i in range(count):
+                if(len(self.rx) < length + LENGTH_STRUCT.size):
+                    return None
+                length += LENGTH_STRUCT.size + LENGTH_STRUCT.unpack_from(self.rx, length)[0]
+            return length
+
+        return 1
+
+    ## Handle the next command.
+     #
+     # Returns False if the next command isn't complete.
+    ################################################################################
+    def handle(self):
+        if(len(self.rx) == 0):
+            return False
+
+        if(self.framing and self.rx[0] == FRAME_SYNC):
+            consumed, seq, packet = unframe(self.rx)
+            if(consumed == 0):
+                return False
+
+            if(packet == None):
+                # Resync on the next sync byte
+                start = self.rx.find(FRAME_SYNC, 1)
+                del self.rx[:start if start > 0 else len(self.rx)]
+                return True
+
+            del self.rx[:consumed]
+            self.pace(consumed)
+            self.handle_frame(seq, packet)
+            return True
+
+        packet_len = self.command_length()
+        if(packet_len == None or len(self.rx) < packet_len):
+            return False
+
+        packet = bytes(self.rx[:packet_len])
+        del self.rx[:packet_len]
+        self.pace(packet_len)
+        self.dispatch(packet)
+        return True
+
+    ## Handle a framed command.
+     #
+     # Commands are handled in sequence order, commands received after a gap
+     # are held until the missing command is retransmitted. A command that was
+     # already handled is answered with the event sent for it, so the codec
+     # doesn't run twice. A framed capabilities command starts the sequence.
+    ################################################################################
+    def handle_frame(self, seq, packet):
+        if(len(packet) and packet[0] == CMD_CAPABILITIES):
+            self.expected = seq
+            self.held.clear()
+            self.sent.clear()
+
+        if(self.expected == None):
+            return
+
+        # Sequence numbers up to half the range behind were already handled
+        if((seq - self.expected) & 0xFF >= 0x80):
+            if(seq in self.sent):
+                self.transmit(self.sent[seq])
+            return
+
+        self.held[seq] = packet
+        while(self.expected in self.held):
+            self.seq = self.expected
+            self.expected = (self.expected + 1) & 0xFF
+            self.dispatch(self.held.pop(self.seq))
+        self.seq = None
+
+    ## Handle a command.
+    ################################################################################
+    def dispatch(self, packet):
+        if(len(packet) == 0):
+            return
+
+        opcode = packet[0]
+        if(opcode == CMD_INIT_ENCODER or opcode == CMD_INIT_DECODER):
+            self.send(bytes([EVT_STATUS, self.start_codec(packet), opcode]))
+
+        elif(opcode == CMD_ENCODE):
+            result = self.run(self.backend.encode, packet[1:])
+            self.send_result(EVT_ENCODE, result, len(result) if result != None else 0)
+
+        elif(opcode == CMD_DECODE):
+            result = self.run(self.backend.decode, packet[1:])
+            self.send_result(EVT_DECODE, result, len(result)//2 if result != None else 0)
+
+        elif(opcode == CMD_EXEC_TIME):
+            self.send(bytes([EVT_EXEC_TIME]) + EXEC_TIME_STRUCT.pack(self.execTime))
+
+        elif((self.max_batch or self.framing) and opcode == CMD_CAPABILITIES):
+            version = FRAMING_VERSION if self.framing else 1
+            self.send(bytes([EVT_CAPABILITIES]) + CAPS_STRUCT.pack(version, max(self.max_batch, 1)))
+
+        elif(self.max_batch and opcode == CMD_BATCH_ENCODE):
+            self.batch_encode(packet)
+
+        elif(self.max_batch and opcode == CMD_BATCH_DECODE):
+            self.batch_decode(packet)
+
+    ## Encode a batch of frames.
+     #
+     # The frames are sent back prefixed with their length, the execution time
+     # is the total of the batch.
+    ################################################################################
+    def batch_encode(self, packet):
+        opcode, count, samples = BATCH_ENCODE_STRUCT.unpack_from(packet)
+        data = packet[BATCH_ENCODE_STRUCT.size:]
+
+        results = []
+        execTime = 0
+        for i in range(count):
+            results.append(self.run(self.backend.encode, data[i*samples*2:(i+1)*samples*2]))
+            execTime += self.execTime
+
+        self.execTime = execTime & 0xFFFFFFFF
+        self.send_batch(EVT_BATCH_ENCODE, count, results, True)
+
+    ## Decode a batch of frames.
+     #
+     # The execution time is the total of the batch.
+    ################################################################################
+    def batch_decode(self, packet):
+        opcode, count = BATCH_DECODE_STRUCT.unpack_from(packet)
+
+        results = []
+        execTime = 0
+        offset = BATCH_DECODE_STRUCT.size
+        for i in range(count):
+            length = LENGTH_STRUCT.unpack_from(packet, offset)[0]
+            offset += LENGTH_STRUCT.size
+            results.append(self.run(self.backend.decode, packet[offset:offset + length]))
+            execTime += self.execTime
+            offset += length
+
+        self.execTime = execTime & 0xFFFFFFFF
+        self.send_batch(EVT_BATCH_DECODE, count, results, False)
+
+    ## Send a batch result.
+     #
+     # The batch fails if any frame failed or the batch is too large.
+    ################################################################################
+    def send_batch(self, evt, count, results, prefix):
+        if(count > self.max_batch or None in results):
+            self.send(bytes([evt, 1]) + BATCH_RESULT_STRUCT.pack(0, 0))
+            return
+
+        if(prefix):
+            results = [LENGTH_STRUCT.pack(len(result)) + result for result in results]
+
+        data = b"".join(results)
+        self.send(bytes([evt, 0]) + BATCH_RESULT_STRUCT.pack(count, len(data)) + data)
+
+    ## Initialize the encoder or decoder.
+     #
+     # Returns the status.
+    ################################################################################
+    def start_codec(self, packet):
+        opcode, frame_len, sample_rate, bitrate = INIT_STRUCT.unpack(packet)
+
+        # Same frame sizes as the host
+        self.frame_samples = int(sample_rate*frame_duration_ms(frame_len)/1000)
+        self.frame_bytes = int(bitrate*frame_duration_ms(frame_len)/8000)
+
+        try:
+            if(opcode == CMD_INIT_ENCODER):
+                self.backend.init_encoder(frame_len, sample_rate, bitrate)
+            else:
+                self.backend.init_decoder(frame_len, sample_rate, bitrate)
+        except Exception as err:
+            print("Error initializing backend: "+str(err), file=sys.stderr)
+            return 1
+
+        return 0
+
+    ## Run the backend.
+     #
+     # The execution time is reported in ns. Returns None on an error.
+    ################################################################################
+    def run(self, func, data):
+        start = perf_counter()
+        try:
+            result = func(data)
+        except Exception as err:
+            print("Error in backend: "+str(err), file=sys.stderr)
+            result = None
+        self.execTime = int((perf_counter() - start)*1e9) & 0xFFFFFFFF
+        return result
+
+    def send_result(self, evt, result, count):
+        status = 0 if result != None else 1
+        self.send(bytes([evt]) + RESULT_STRUCT.pack(status, count) + (result or b""))
+
+    ## Send an event.
+     #
+     # Events of framed commands are framed with the sequence number of the
+     # command and kept for retransmission.
+    ################################################################################
+    def send(self, packet):
+        if(self.seq != None):
+            packet = frame_packet(self.seq, packet)
+            self.sent.pop(self.seq, None)
+            self.sent[self.seq] = packet
+            if(len(self.sent) > 0x80):
+                self.sent.popitem(last = False)
+
+        self.transmit(packet)
+
+    ## Transmit bytes.
+     #
+     # Applies the latency, pacing and error injection.
+    ################################################################################
+    def transmit(self, packet):
+        if(self.latency):
+            sleep(self.latency)
+
+        if(self.random.random() < self.drop):
+            return
+
+        if(self.random.random() < self.garbage):
+            packet = bytes([0xFF]) + packet
+
+        if(self.random.random() < self.corrupt):
+            packet = bytearray(packet)
+            packet[self.random.randrange(len(packet))] ^= 1 << self.random.randrange(8)
+            packet = bytes(packet)
+
+        self.pace(len(packet))
+        os.write(self.master, packet)
+
+def main():
+    descText = """
+LC3 controller emulator.
+
+Implements the UART protocol of the LC3 controller example on a pseudo-terminal
+and prints its path. Use the path as the serial port of LC3.py to run the host
+tools without a device. The encoding and decoding is done by a backend, null
+returns silence and liblc3 uses the lc3 Python module. Custom backends are
+given as module:Class.
+"""
+    parser = argparse.ArgumentParser(description=descText, formatter_class=RawTextHelpFormatter)
+    parser.add_argument('--backend', default="null",
+                        help='Backend: '+", ".join(BACKENDS)+" or module:Class, default: null")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Latency before each event in seconds, default: 0')
+    parser.add_argument('--baud', type=int, default=None,
+                        help='Pace the transfers at this baud rate, default: no pacing')
+    parser.add_argument('--drop', type=float, default=0.0,
+                        help='Probability an event is dropped, default: 0')
+    parser.add_argument('--corrupt', type=float, default=0.0,
+                        help='Probability a bit of an event is flipped, default: 0')
+    parser.add_argument('--garbage', type=float, default=0.0,
+                        help='Probability an unknown byte precedes an event, default: 0')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for the error injection')
+    parser.add_argument('--max-batch', type=int, default=0,
+                        help='Maximum frames per batch command, default: 0 (no batch commands)')
+    parser.add_argument('--framing', action='store_true',
+                        help='Support the sequence numbered framing')
+    parser.add_argument('--single', action='store_true',
+                        help='Emulate a device with a single codec instance, an encoder or a decoder')
+    parser.add_argument('--link', default=None,
+                        help='Create a symbolic link to the pseudo-terminal')
+    args = parser.parse_args()
+
+    backend = load_backend(args.backend)
+    if(args.single):
+        backend = SingleInstanceBackend(backend)
+
+    emulator = Emulator(backend, args.latency, args.baud,
+                        args.drop, args.corrupt, args.garbage, args.seed, args.max_batch,
+                        args.framing)
+
+    port = emulator.port()
+    if(args.link != None):
+        if(os.path.lexists(args.link)):
+            os.unlink(args.link)
+        os.symlink(port, args.link)
+        port = args.link
+
+    print(port, flush=True)
+
+    try:
+        emulator.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if(args.link != None):
+            os.unlink(args.link)
+
+if __name__ == '__main__':
+    main()
+
+### ------------------------------------------------------------------------ ###
@@ -40,13 +40,18 @@
 
 import wave
 from hci import HCI
+from stats import print_summary, print_rtf
+from framelog import FrameLog
+from time import perf_counter
+from checkpoint import CHECKPOINT_FRAMES, job_key, load_checkpoint, \
+    save_checkpoint, remove_checkpoint
+from bitstream import BIN_HEADER, is_stdio, open_input, open_output, wav_frames, \
+    write_bin_header
+from channels import run_channels, split_channels
+from realtime import Pacer
+from itertools import islice
 import os
 
-def chunks(lst, n):
-    """Yield successive n-sized chunks from lst."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
-
 class Encoder:
 
     def __init__(self):
@@ -54,67 +59,161 @@ class Encoder:
 
 
 
-    def encode(hci, input, output, bitrate, frame_len=10):
+    ## Encode a wav file.
+     #
+     # devices are more HCIs for the channels of a multichannel file, the
+     # channels run concurrently on different devices. realtime sends the
+     # frames at the frame interval and counts the results later than deadline
+     # ms, one frame interval by default.
+    ################################################################################
+    def encode(hci, input, output, bitrate, frame_len=10, window=1, profile=1, batch=1, resume=False, log=None,
+               devices=[], realtime=False, deadline=None):
         print("\nEncoder")
         
-        # Parse the wave file
-        input_wav = wave.open(input, 'rb')
-
-        nchannels = input_wav.getnchannels()
-        samplewidth = input_wav.getsampwidth()
-        framerate = input_wav.getframerate()
-        nframes = input_wav.getnframes()
-
-        frame_samples = int(framerate*(int(frame_len)/1000))
-        frame_count = int(nframes / frame_samples)
-
-        print("Channels     :", nchannels)
-        print("Sample width :", samplewidth)
-        print("Sample Rate  :", framerate)
-        print("Samples      :", nframes)
-        print("Frame Len    :", frame_len)
-        print("Bitrate      :", bitrate)
-        print("Frame samples:", frame_samples)
-        print("Frame count  :", frame_count)
-
-        # Send the command to initialize the encoder
-        if(not hci.init_encoder(frame_len, framerate, bitrate)):
-            return 1
-
-        # wave class calls each sample a frame, whereas we're calling a frame 
-        # a set of samples equaling frame_len
-        samples = input_wav.readframes(input_wav.getnframes())
-
-        # Segment the samples into frames of frame_len, easy sample is 2 bytes
-        frames = chunks(samples, frame_samples*2)
-
-        # Setup the output bin file
-        output_bin = open(output, 'wb')
-        output_bin.write((0xcc1c).to_bytes(2, 'little')) # File ID
-        output_bin.write((0x0012).to_bytes(2, 'little')) # Header length
-        output_bin.write(int((int(framerate)/100)).to_bytes(2, 'little'))
-        output_bin.write(int((int(bitrate)/100)).to_bytes(2, 'little'))
-        output_bin.write((nchannels).to_bytes(2, 'little'))
-        output_bin.write(int((int(frame_len)*100)).to_bytes(2, 'little'))
-        output_bin.write((0x0000).to_bytes(2, 'little')) # RFU
-        output_bin.write((nframes & 0xFFFF).to_bytes(2, 'little'))
-        output_bin.write(((nframes & 0xFFFF0000) >> 16).to_bytes(2, 'little'))
-
-        # Save the encoded samples to the output bin file
-        for frame in frames:
-            # Send the encode command for each frame
-            encoded_frame, execTime = hci.encode(frame)
-
-            if(encoded_frame == None):
-                print("Error encoding frame")
+        # Parse the wave file, the samples are read frame by frame
+        input_file = open_input(input)
+        input_wav = output_bin = frameLog = None
+        try:
+            input_wav = wave.open(input_file, 'rb')
+
+            nchannels = input_wav.getnchannels()
+            samplewidth = input_wav.getsampwidth()
+            framerate = input_wav.getframerate()
+            nframes = input_wav.getnframes()
+
+            frame_samples = int(framerate*(float(frame_len)/1000))
+            frame_count = int(nframes / frame_samples)
+
+            print("Channels     :", nchannels)
+            print("Sample width :", samplewidth)
+            print("Sample Rate  :", framerate)
+            print("Samples      :", nframes)
+            print("Frame Len    :", frame_len)
+            print("Bitrate      :", bitrate)
+            print("Frame samples:", frame_samples)
+            print("Frame count  :", frame_count)
+            print("Window       :", window)
+            print("Profile      :", profile)
+            print("Batch        :", batch)
+
+            if(samplewidth != 2):
+                print("Error: only 16 bit samples are supported")
                 return 1
 
-            output_bin.write(encoded_frame)
-
-            print(os.path.basename(input),",",framerate,",",bitrate,",",execTime,", encode")
-                
-        output_bin.close();
-
-        return 0
+            # One device per channel at most
+            hcis = ([hci] + list(devices))[:nchannels]
+            print("Devices      :", len(hcis))
+
+            # Continue after the last checkpoint of a previous run. The device can't
+            # save the codec state and it doesn't settle in a fixed number of
+            # frames, all the frames before the checkpoint are encoded again to
+            # rebuild it and their results are discarded.
+            if(resume and (is_stdio(input) or is_stdio(output))):
+                print("Can't resume with the standard input or output")
+                resume = False
+            key = job_key("E", input, [str(bitrate), str(frame_len)]) if resume else None
+            start, length = load_checkpoint(output, key) if resume else (0, 0)
+            if(start and (not os.path.exists(output) or os.path.getsize(output) < BIN_HEADER.size + length)):
+                print("Output doesn't match the checkpoint, starting over")
+                start, length = 0, 0
+
+            # Send the command to initialize the encoder of the first channel of
+            # each device, the bitrate is shared by the channels as in the
+            # reference encoder
+            channelBitrate = int(bitrate)//nchannels
+            for device in hcis:
+                if(not device.init_encoder(frame_len, framerate, channelBitrate)):
+                    return 1
+
+            def run(device, channel, channelFrames):
+                if(channel >= len(hcis) and not device.init_encoder(frame_len, framerate, channelBitrate)):
+                    yield None, None
+                    return
+
+                # The frames before the checkpoint aren't profiled
+                channelFrames = iter(channelFrames)
+                if(start):
+                    yield from device.encode_frames(islice(channelFrames, start), window, 0, batch)
+                perCommand = device.frames_per_command(batch)
+                yield from device.encode_frames(channelFrames, window, profile, batch, (start + perCommand - 1)//perCommand)
+
+            # wave class calls each sample a frame, whereas we're calling a frame 
+            # a set of samples equaling frame_len
+            frames = (split_channels(frame, nchannels) for frame in wav_frames(input_wav, frame_samples))
+            pacer = Pacer(frame_len, deadline) if realtime else None
+            if(pacer != None):
+                frames = pacer.pace(frames)
+
+            if(start):
+                # Keep the frames written before the checkpoint
+                print("Resuming at frame", start, "after encoding the frames before it again")
+                output_bin = open_output(output, 'r+b')
+                output_bin.truncate(BIN_HEADER.size + length)
+                output_bin.seek(0, os.SEEK_END)
+            else:
+                # Setup the output bin file
+                output_bin = open_output(output)
+                write_bin_header(output_bin, framerate, bitrate, nchannels, frame_len, nframes)
+
+            # Save the encoded samples to the output bin file
+            execTimes = []
+            frameLog = FrameLog(log)
+            count = 0
+            wall = perf_counter()
+            results = run_channels(hcis, nchannels, frames, run)
+            for index, channelResults in enumerate(results):
+
+                if(any(encoded_frame == None for encoded_frame, execTime, roundTrip in channelResults)):
+                    print("Error encoding frame")
+                    if(resume):
+                        output_bin.flush()
+                        save_checkpoint(output, key, max(index, start), length)
+                    return 1
+
+                latency = pacer.result() if pacer != None else None
+
+                # Discard the frames before the checkpoint
+                if(index < start):
+                    continue
+
+                # The frames of the channels follow each other, each one is
+                # prefixed with its length
+                for encoded_frame, execTime, roundTrip in channelResults:
+                    output_bin.write(encoded_frame)
+                    length += len(encoded_frame)
+                    frameLog.record(index, len(encoded_frame) - 2, execTime, roundTrip, latency)
+
+                    if(execTime != None):
+                        execTimes.append(execTime)
+                        if(log == None):
+                            print(os.path.basename(input),",",framerate,",",bitrate,",",execTime,", encode")
+                count += 1
+
+                if(resume and (index + 1) % CHECKPOINT_FRAMES == 0):
+                    output_bin.flush()
+                    save_checkpoint(output, key, index + 1, length)
+
+            output_bin.close()
+            wall = perf_counter() - wall
+
+            if(resume):
+                remove_checkpoint(output)
+
+            if(profile > 0):
+                print_summary("\nEncode execution time", execTimes, "cycles")
+            print_summary("\nEncode round trip", frameLog.roundTrips, "ms")
+            print_rtf("\nEncode real time factor", count, wall, count*float(frame_len)/1000)
+            if(pacer != None):
+                pacer.print_summary("\nEncode real-time latency")
+
+            return 0
+        finally:
+            if(output_bin != None):
+                output_bin.close()
+            if(input_wav != None):
+                input_wav.close()
+            if(frameLog != None):
+                frameLog.close()
+            input_file.close()
 
 ### ------------------------------------------------------------------------ ###
@@ -0,0 +1,125 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+
+## framelog.py
+ #
+ # Per-frame timing log of encoder and decoder jobs
+ #
+
+import csv
+import struct
+
+# Binary log, a magic followed by one record per frame
+FRAME_LOG_MAGIC  = b"LC3T"
+FRAME_RECORD     = struct.Struct("<IHIff")  # frame index, bytes, execution time, round trip and latency in seconds
+
+# Execution time of frames that weren't profiled in the binary log
+NO_EXEC_TIME     = 0xFFFFFFFF
+
+## Per-frame timing log.
+ #
+ # Records the frame index, the number of encoded bytes or decoded samples
+ # bytes, the execution time, the host round trip and the real-time latency
+ # of each frame. The log is written as CSV if the path ends with .csv,
+ # binary records otherwise. The round trips are also kept for the summary.
+################################################################################
+class FrameLog:
+
+    def __init__(self, path = None):
+        self.path = path
+        self.roundTrips = []
+        self.file = None
+        self.writer = None
+
+        if(path == None):
+            return
+
+        if(str(path).lower().endswith(".csv")):
+            self.file = open(path, "w", newline="")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(["index", "bytes", "exec_time", "round_trip_ms", "latency_ms"])
+        else:
+            self.file = open(path, "wb")
+            self.file.write(FRAME_LOG_MAGIC)
+
+    ## Record a frame.
+     #
+     # execTime, roundTrip and latency are None when they weren't measured.
+    ################################################################################
+    def record(self, index, nbytes, execTime, roundTrip, latency = None):
+        if(roundTrip != None):
+            self.roundTrips.append(roundTrip*1000)
+
+        if(self.writer != None):
+            self.writer.writerow([index, nbytes, "" if execTime == None else execTime,
+                                  "" if roundTrip == None else "%.3f" % (roundTrip*1000),
+                                  "" if latency == None else "%.3f" % (latency*1000)])
+        elif(self.file != None):
+            self.file.write(FRAME_RECORD.pack(index, nbytes,
+                            NO_EXEC_TIME if execTime == None else execTime,
+                            float("nan") if roundTrip == None else roundTrip,
+                            float("nan") if latency == None else latency))
+
+    def close(self):
+        if(self.file != None):
+            self.file.close()
+            self.file = None
+
+## Read a binary frame log.
+ #
+ # Returns a list of index, bytes, execTime, roundTrip, latency tuples, with
+ # None for the values that weren't measured.
+################################################################################
+def read_frame_log(path):
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if(data[:len(FRAME_LOG_MAGIC)] != FRAME_LOG_MAGIC):
+        raise ValueError("Not a frame log: "+str(path))
+
+    # Ignore a partial record at the end of the log of a failed job
+    data = data[len(FRAME_LOG_MAGIC):]
+    data = data[:len(data) - len(data) % FRAME_RECORD.size]
+
+    records = []
+    for index, nbytes, execTime, roundTrip, latency in FRAME_RECORD.iter_unpack(data):
+        records.append((index, nbytes, None if execTime == NO_EXEC_TIME else execTime,
+                        None if roundTrip != roundTrip else roundTrip,
+                        None if latency != latency else latency))
+
+    return records
+
+### ------------------------------------------------------------------------ ###
@@ -40,66 +40,427 @@
 
 import serial
 import datetime
-from time import sleep
-import codecs
+import struct
+from array import array
+from binascii import crc_hqx
+from collections import deque, namedtuple
+from time import perf_counter
+
+# Command opcodes, host to controller
+CMD_INIT_ENCODER = 0x01
+CMD_ENCODE       = 0x02
+CMD_INIT_DECODER = 0x03
+CMD_DECODE       = 0x04
+CMD_EXEC_TIME    = 0x05
+CMD_CAPABILITIES = 0x0A
+CMD_BATCH_ENCODE = 0x0B
+CMD_BATCH_DECODE = 0x0C
+
+# Event opcodes, controller to host
+EVT_STATUS       = 0x06
+EVT_ENCODE       = 0x07
+EVT_DECODE       = 0x08
+EVT_EXEC_TIME    = 0x09
+EVT_CAPABILITIES = 0x0D
+EVT_BATCH_ENCODE = 0x0E
+EVT_BATCH_DECODE = 0x0F
+
+# Packet layouts, all fields are LSB first
+INIT_STRUCT      = struct.Struct("<BBHI")   # opcode, frame duration, sample rate, bit rate
+STATUS_STRUCT    = struct.Struct("<BB")     # status, command being acknowledged
+RESULT_STRUCT    = struct.Struct("<BH")     # status, number of bytes or samples
+LENGTH_STRUCT    = struct.Struct("<H")      # frame length prefix in the .bin file
+EXEC_TIME_STRUCT = struct.Struct("<I")      # execution time in cycles
+CAPS_STRUCT      = struct.Struct("<BH")     # protocol version, max frames per batch
+BATCH_ENCODE_STRUCT = struct.Struct("<BHH") # opcode, number of frames, samples per frame
+BATCH_DECODE_STRUCT = struct.Struct("<BH")  # opcode, number of frames
+BATCH_RESULT_STRUCT = struct.Struct("<HI")  # number of frames, number of bytes, after the status
+
+# Framing, the header is the sync byte, sequence number, packet length and a
+# check byte over the header, the packet is followed by a CRC-16/CCITT over the
+# sequence number, length and packet
+FRAME_SYNC       = 0xA5
+FRAME_STRUCT     = struct.Struct("<BBHB")   # sync, sequence number, packet length, header check
+CRC_STRUCT       = struct.Struct("<H")      # CRC-16/CCITT of the frame
+
+# Capabilities version of devices that support the framing
+FRAMING_VERSION  = 2
+
+# Number of bytes after the event opcode needed to know the event length
+EVENT_HEADERS = {
+    EVT_STATUS:       STATUS_STRUCT.size,
+    EVT_ENCODE:       RESULT_STRUCT.size,
+    EVT_DECODE:       RESULT_STRUCT.size,
+    EVT_EXEC_TIME:    0,
+    EVT_CAPABILITIES: 0,
+    EVT_BATCH_ENCODE: 1 + BATCH_RESULT_STRUCT.size,
+    EVT_BATCH_DECODE: 1 + BATCH_RESULT_STRUCT.size,
+}
+
+# Response timeout limits in seconds, with the framing the timeout adapts to
+# the observed response time of the device within these limits. Without the
+# framing a late event can't be told apart from the event of the next command,
+# so the timeout stays at MAX_TIMEOUT.
+MIN_TIMEOUT      = 0.05
+MAX_TIMEOUT      = 1.0
+
+# Time the line must be idle before a partial event is considered flushed
+DRAIN_IDLE       = 0.02
+
+# Commands that can be sent again without the framing when their event is
+# lost, the others change the codec state
+IDEMPOTENT_COMMANDS = (CMD_INIT_ENCODER, CMD_INIT_DECODER, CMD_EXEC_TIME, CMD_CAPABILITIES)
+
+# Time to wait for the capabilities event, devices without batch support
+# don't answer the capabilities command
+NEGOTIATE_TIMEOUT = 0.1
+
+# Number of capabilities commands sent to get two matching events, the event
+# has no CRC without the framing
+NEGOTIATE_ATTEMPTS = 4
+
+# Largest number of frames per batch used whatever the capabilities event
+# reports, a batch of 48 kHz 10 ms frames then fits in a framed packet
+MAX_BATCH        = 64
+
+## Get the frame duration code of the start commands.
+ #
+ # 0x0A for 10 ms frames and 0x4B for 7.5 ms frames, frame_len is in ms.
+################################################################################
+def frame_duration_code(frame_len):
+    if(float(frame_len) == 7.5):
+        return 0x4B
+
+    return int(float(frame_len))
+
+## Get the frame duration in ms from the code of the start commands.
+################################################################################
+def frame_duration_ms(code):
+    return 7.5 if code == 0x4B else code
+
+## Check the profiling policy.
+ #
+ # profile is 0 to never query the execution time, 1 to query it after every
+ # frame and N to query it after every Nth frame.
+################################################################################
+def profile_frame(index, profile):
+    return profile > 0 and index % profile == 0
+
+## HCI event.
+ #
+ # evt is the event opcode, status is 0 on success and payload is a
+ # memoryview over the received event data.
+################################################################################
+HCIEvent = namedtuple("HCIEvent", ["evt", "status", "payload"])
+
+## Get the length of an event.
+ #
+ # data starts with the event opcode. Returns the length of the whole event,
+ # None if more data is needed to know it, or 0 for an unknown event.
+################################################################################
+def event_length(data):
+    evt = data[0]
+
+    if(evt == EVT_STATUS):
+        return 1 + STATUS_STRUCT.size
+
+    if(evt == EVT_ENCODE or evt == EVT_DECODE):
+        if(len(data) < 1 + RESULT_STRUCT.size):
+            return None
+
+        # Decode events count 16 bit samples
+        count = RESULT_STRUCT.unpack_from(data, 1)[1]
+        return 1 + RESULT_STRUCT.size + (count*2 if evt == EVT_DECODE else count)
+
+    if(evt == EVT_EXEC_TIME):
+        return 1 + EXEC_TIME_STRUCT.size
+
+    if(evt == EVT_CAPABILITIES):
+        return 1 + CAPS_STRUCT.size
+
+    if(evt == EVT_BATCH_ENCODE or evt == EVT_BATCH_DECODE):
+        if(len(data) < 2 + BATCH_RESULT_STRUCT.size):
+            return None
+
+        return 2 + BATCH_RESULT_STRUCT.size + BATCH_RESULT_STRUCT.unpack_from(data, 2)[1]
+
+    return 0
+
+## Parse a complete event.
+ #
+ # data holds exactly one event of event_length(data) bytes. The payload of the
+ # batch events starts with the number of frames and bytes.
+################################################################################
+def parse_event(data):
+    evt = data[0]
+    view = memoryview(data)
+
+    if(evt == EVT_STATUS or evt == EVT_BATCH_ENCODE or evt == EVT_BATCH_DECODE):
+        return HCIEvent(evt, data[1], view[2:])
+
+    if(evt == EVT_EXEC_TIME or evt == EVT_CAPABILITIES):
+        return HCIEvent(evt, 0, view[1:])
+
+    return HCIEvent(evt, data[1], view[1 + RESULT_STRUCT.size:])
+
+## Convert an encode event to a frame.
+ #
+ # Returns the encoded bytes prefixed with the 16 bit frame length, as
+ # written to the .bin file, or None if the event is not a valid result.
+################################################################################
+def encode_result(status_evt):
+    if(status_evt == None or status_evt.evt != EVT_ENCODE or status_evt.status != 0):
+        return None
+
+    # Write the number of bytes at the start of the frame
+    return LENGTH_STRUCT.pack(len(status_evt.payload)) + status_evt.payload
+
+## Convert a decode event to samples.
+ #
+ # Samples are 16 bit LSB first, same as the wave file. Returns None if the
+ # event is not a valid result.
+################################################################################
+def decode_result(status_evt):
+    if(status_evt == None or status_evt.evt != EVT_DECODE or status_evt.status != 0):
+        return None
+
+    return status_evt.payload
+
+## Convert an execution time event to cycles.
+ #
+ # Returns None if the event is not an execution time event.
+################################################################################
+def exec_time_result(status_evt):
+    if(status_evt == None or status_evt.evt != EVT_EXEC_TIME):
+        return None
+
+    return EXEC_TIME_STRUCT.unpack(status_evt.payload)[0]
+
+## Compute the CRC of a frame.
+ #
+ # CRC-16/CCITT with an initial value of 0xFFFF.
+################################################################################
+def frame_crc(data):
+    return crc_hqx(data, 0xFFFF)
+
+## Frame a packet.
+ #
+ # Returns the packet with the framing header and CRC.
+################################################################################
+def frame_packet(seq, packet):
+    header = bytes([FRAME_SYNC, seq]) + CRC_STRUCT.pack(len(packet))
+    header += bytes([frame_crc(header) & 0xFF])
+    return header + packet + CRC_STRUCT.pack(frame_crc(header[1:4] + packet))
+
+## Extract the next frame.
+ #
+ # Returns consumed, seq, packet. consumed is 0 if more data is needed. packet
+ # is None if consumed bytes were skipped to resync on the next sync byte,
+ # after garbage, a bad header check or a bad CRC.
+################################################################################
+def unframe(data):
+    start = data.find(FRAME_SYNC)
+    if(start < 0):
+        return len(data), None, None
+    if(start > 0):
+        return start, None, None
+
+    if(len(data) < FRAME_STRUCT.size):
+        return 0, None, None
+
+    sync, seq, length, check = FRAME_STRUCT.unpack_from(data)
+    if(check != frame_crc(data[:FRAME_STRUCT.size - 1]) & 0xFF):
+        return 1, None, None
+
+    end = FRAME_STRUCT.size + length + CRC_STRUCT.size
+    if(len(data) < end):
+        return 0, None, None
+
+    packet = bytes(data[FRAME_STRUCT.size:end - CRC_STRUCT.size])
+    crc = CRC_STRUCT.unpack_from(data, end - CRC_STRUCT.size)[0]
+    if(crc != frame_crc(bytes(data[1:4]) + packet)):
+        return 1, None, None
+
+    return end, seq, packet
+
+## Split frames into batches.
+ #
+ # Batches hold up to size consecutive frames of the same length, so a short
+ # last frame goes in a batch of its own.
+################################################################################
+def batches(frames, size):
+    batch = []
+    for frame in frames:
+        if(len(batch) == size or (len(batch) and len(frame) != len(batch[0]))):
+            yield batch
+            batch = []
+        batch.append(frame)
+
+    if(len(batch)):
+        yield batch
+
+## Build a batch encode command.
+ #
+ # All frames of the batch have the same number of samples.
+################################################################################
+def batch_encode_packet(frames):
+    return BATCH_ENCODE_STRUCT.pack(CMD_BATCH_ENCODE, len(frames), len(frames[0])//2) + b"".join(frames)
+
+## Build a batch decode command.
+ #
+ # Each frame is prefixed with its 16 bit length, as in the .bin file.
+################################################################################
+def batch_decode_packet(frames):
+    return BATCH_DECODE_STRUCT.pack(CMD_BATCH_DECODE, len(frames)) + \
+        b"".join(LENGTH_STRUCT.pack(len(frame)) + frame for frame in frames)
+
+## Convert a batch encode event to frames.
+ #
+ # The event holds the frames prefixed with their 16 bit length, as written to
+ # the .bin file. Returns a list with a memoryview of each frame, or None if the
+ # event is not a valid result.
+################################################################################
+def batch_encode_results(status_evt):
+    if(status_evt == None or status_evt.evt != EVT_BATCH_ENCODE or status_evt.status != 0):
+        return None
+
+    count, length = BATCH_RESULT_STRUCT.unpack_from(status_evt.payload)
+    data = status_evt.payload[BATCH_RESULT_STRUCT.size:]
+
+    frames = []
+    offset = 0
+    for i in range(count):
+        end = offset + LENGTH_STRUCT.size + LENGTH_STRUCT.unpack_from(data, offset)[0]
+        frames.append(data[offset:end])
+        offset = end
+
+    return frames
+
+## Convert a batch decode event to samples.
+ #
+ # The frames of a batch have the same number of samples. Returns a list with
+ # a memoryview of each frame, or None if the event is not a valid result.
+################################################################################
+def batch_decode_results(status_evt):
+    if(status_evt == None or status_evt.evt != EVT_BATCH_DECODE or status_evt.status != 0):
+        return None
+
+    count, length = BATCH_RESULT_STRUCT.unpack_from(status_evt.payload)
+    if(count == 0):
+        return []
+
+    data = status_evt.payload[BATCH_RESULT_STRUCT.size:]
+    size = length//count
+
+    return [data[i*size:(i+1)*size] for i in range(count)]
 
 class HCI:
 
     def __init__(self, serial_port):
         self.serial_port = serial_port
 
-    ## Parse int to hex string, LSB first.
-     #
-     # Reverses a hex number to bytes, LSB first.
-    ################################################################################
-    def parseIntHexString(self, num, numNibbles=8):
+        # Maximum number of frames per batch command and capabilities version,
+        # None until negotiated. version stays None if the device didn't
+        # answer, the negotiation is then tried again for the next job.
+        self.max_batch = None
+        self.version = None
+
+        # Framing state, the next sequence number, the commands waiting for
+        # their event by sequence number, the events received ahead of the
+        # one being waited for and the received bytes not framed yet
+        self.framing = False
+        self.seq = 0
+        self.inflight = {}
+        self.early = {}
+        self.rx = bytearray()
+
+        # Smoothed response time and its mean deviation, None until measured
+        self.rtt = None
+        self.rttvar = None
 
-        # Make sure the numNibbles is even
-        if(numNibbles % 2 != 0):
-            print("Error: numNimbbles must be even")
-            return ""
+        # Completion time of the last pipelined frame
+        self.last_result = 0.0
 
-        # Convert int to hex string
-        num = hex(int(num))
+        # Response time of the last frame or batch command in seconds
+        self.round_trip = None
 
-        # Remove the 0x
-        num = num[2:]
+        # True if the device keeps the encoder and the decoder state apart,
+        # None until checked or if the check failed
+        self.separate_codecs = None
 
-        # Add a leading zero if necessary
-        if(len(num) % 2 != 0):
-            num = "0" + num
+    ## Set the serial port timeout.
+     #
+     # Reconfiguring the port is a system call on most platforms, only do it
+     # when the timeout changes.
+    ################################################################################
+    def set_timeout(self, timeout):
+        if(self.serial_port.timeout != timeout):
+            self.serial_port.timeout = timeout
 
-        # Make sure we don't overflow numNibbles
-        if(len(num) > numNibbles):
-            print("Error, numNimbbles overflow")
-            return ""
+    ## Get the response timeout.
+     #
+     # With the framing, uses the smoothed response time plus four times its
+     # deviation, as TCP does for retransmissions, clamped to MIN_TIMEOUT and
+     # MAX_TIMEOUT. Rounded to milliseconds so small variations don't
+     # reconfigure the port. Without the framing it is always MAX_TIMEOUT.
+    ################################################################################
+    def response_timeout(self):
+        if(self.rtt == None or not self.framing):
+            return MAX_TIMEOUT
 
-        # Pad out to the number of nibbles
-        if(len(num) < numNibbles):
-            for i in range (0,(numNibbles - len(num))):
-                num = "0"+num
+        timeout = round(self.rtt + 4*self.rttvar, 3)
+        return min(max(timeout, MIN_TIMEOUT), MAX_TIMEOUT)
 
-        # Split the number into bytes
-        chunks, chunk_size = numNibbles, 2
-        addrBytes = [ num[i:i+chunk_size] for i in range(0, chunks, chunk_size) ]
+    ## Update the response time estimate.
+    ################################################################################
+    def update_rtt(self, sample):
+        self.round_trip = sample
+        if(self.rtt == None):
+            self.rtt = sample
+            self.rttvar = sample/2
+        else:
+            self.rttvar = 0.75*self.rttvar + 0.25*abs(self.rtt - sample)
+            self.rtt = 0.875*self.rtt + 0.125*sample
 
-        # Reverse the bytes to LSB first
-        numString = ""
-        for i in range (int(numNibbles/2)-1, -1, -1):
-            numString = numString + addrBytes[i]
+    ## Read exactly size bytes.
+     #
+     # Each read blocks until the data arrives or the port times out. Returns
+     # None if the deadline passes before size bytes arrive.
+    ################################################################################
+    def read_exact(self, size, deadline):
+        data = self.serial_port.read(size=size)
+        while(len(data) < size):
+            if(perf_counter() >= deadline):
+                return None
+            data += self.serial_port.read(size=size-len(data))
 
-        return numString
+        return data
 
+    ## Drain the receive buffer.
+     #
+     # Reads until the line has been idle for idle seconds, so the rest of a
+     # partially received event is discarded. Waiting for the response timeout
+     # also discards the late events of commands that timed out.
+    ################################################################################
+    def drain(self, idle = DRAIN_IDLE):
+        self.set_timeout(idle)
+        while(len(self.serial_port.read(size=4096))):
+            pass
+        self.serial_port.reset_input_buffer()
 
     ## Wait for an HCI event.
      #
      # Waits for an HCI event, optionally prints the received event. 
-     # Will timeout on the serial port if nothing arrives.
+     # Will timeout on the serial port if nothing arrives. The whole event must
+     # arrive within timeout, which defaults to the adaptive response timeout.
     ################################################################################
-    def wait_event(self, print_evt = True, timeout=1.0):
+    def wait_event(self, print_evt = True, timeout=None):
 
         # Set the serial port timeout
-        self.serial_port.timeout=timeout
+        if(timeout == None):
+            timeout = self.response_timeout()
+        self.set_timeout(timeout)
+        deadline = perf_counter() + timeout
 
         # Receive the event
         evt=self.serial_port.read(size=1)
@@ -107,73 +468,31 @@ class HCI:
             self.serial_port.reset_input_buffer()
             return None
 
-        evt=int(codecs.encode(evt, 'hex_codec'),16)
-        status_string = '%02X'%evt
-
-        if(evt == 6):
-            # Receive the status event
-            hdr = self.serial_port.read(size=2)
-            hdr=int(codecs.encode(hdr, 'hex_codec'),16)
-            packet_len = 0
-            status_string+= '%04X'%hdr
-
-
-        elif(evt == 7):
-            # Receive the encode event status
-            status = self.serial_port.read(size=1)
-            status = int(codecs.encode(status, 'hex_codec'),16)
-            status_string+= '%02X'%status
-
-            # Receive the length, byte swap from LSB first
-            packet_len0 = self.serial_port.read(size=1)
-            packet_len0 = int(codecs.encode(packet_len0, 'hex_codec'),16)
-            packet_len1 = self.serial_port.read(size=1)
-            packet_len1 = int(codecs.encode(packet_len1, 'hex_codec'),16)
-
-            status_string+= '%02X'%packet_len0
-            status_string+= '%02X'%packet_len1
-            packet_len = packet_len0 + (packet_len1 << 8)
-            packet_len = int(packet_len)
-
-        elif(evt == 8):
-            # Receive the encode event status
-            status = self.serial_port.read(size=1)
-            status = int(codecs.encode(status, 'hex_codec'),16)
-            status_string+= '%02X'%status
-
-            # Receive the length, byte swap from LSB first
-            packet_len0 = self.serial_port.read(size=1)
-            packet_len0 = int(codecs.encode(packet_len0, 'hex_codec'),16)
-            packet_len1 = self.serial_port.read(size=1)
-            packet_len1 = int(codecs.encode(packet_len1, 'hex_codec'),16)
-            
-            # Length is number of 16 bit samples
-            status_string+= '%02X'%packet_len0
-            status_string+= '%02X'%packet_len1
-            packet_len = packet_len0 + (packet_len1 << 8)
-            packet_len = int(packet_len*2)
-
-        elif(evt == 9):
-            # Read the execution time
-            packet_len = 4
+        if(evt[0] not in EVENT_HEADERS):
+            print(str(datetime.datetime.now()) + "Error: unknown evt = "+str(evt[0]))
+            # Discard the rest of the event
+            self.drain()
+            return None
 
-        else:
-            print(str(datetime.datetime.now()) + "Error: unknown evt = "+str(evt))
-            # Wait for the event to finish being received
-            sleep(0.1)
-            self.serial_port.reset_input_buffer()
+        # Receive the header, then the rest of the event
+        data = evt
+        hdr = self.read_exact(EVENT_HEADERS[evt[0]], deadline)
+        if(hdr != None):
+            data += hdr
+            payload = self.read_exact(event_length(data) - len(data), deadline)
+
+        if(hdr == None or payload == None):
+            print(str(datetime.datetime.now()) + "Error: truncated evt = "+str(evt[0]))
+            self.drain()
             return None
 
-        # Read the payload and append to the event
-        payload = self.serial_port.read(size=packet_len)
-        for i in range(0,packet_len):
-            status_string += '%02X'%payload[i]
+        data += payload
 
         # Print the packet
         if(print_evt):
-            print(str(datetime.datetime.now()) + " <", status_string)
+            print(str(datetime.datetime.now()) + " <", data.hex().upper())
 
-        return status_string
+        return parse_event(data)
 
     ## Wait for HCI events.
      #
@@ -191,24 +510,51 @@ class HCI:
 
     ## Send HCI command.
      #
-     # Send a HCI command to the serial port. Will add a small delay and wait for
-     # and print an HCI event by default.
+     # Send a HCI command to the serial port. Will wait for and print an HCI
+     # event by default. packet is a bytes-like object. The response time of
+     # each command updates the adaptive response timeout.
+     #
+     # Without the framing a command is only sent again if it is idempotent,
+     # after the line is drained so the late event of the lost one can't be
+     # taken for the event of the next command. An encode or decode command may
+     # have been processed, so it fails instead.
     ################################################################################
-    def send_command(self, packet, resp = True, delay = 0.01, print_cmd = True, retryCount = 10):
+    def send_command(self, packet, resp = True, print_cmd = True, retryCount = 10):
         # Send the command and data
         if(print_cmd):
-          print(str(datetime.datetime.now()) + " >", packet)
+          print(str(datetime.datetime.now()) + " >", bytes(packet).hex().upper())
+
+        if(self.framing):
+            sent = perf_counter()
+            seq, data = self.command(packet)
+            self.serial_port.write(data)
+            if(not resp):
+                del self.inflight[seq]
+                return None
+
+            status_evt = self.transact(seq, print_cmd, retryCount)
+            if(status_evt != None):
+                self.update_rtt(perf_counter() - sent)
+            return status_evt
 
-        self.serial_port.write(bytearray.fromhex(packet))
-        sleep(delay)
+        sent = perf_counter()
+        self.serial_port.write(packet)
 
         if(resp):
             status_evt = self.wait_event(print_evt = print_cmd)
             while(status_evt == None):
+                # Resync on an idle line, the device may still answer
+                self.drain(MAX_TIMEOUT)
+                if(packet[0] not in IDEMPOTENT_COMMANDS):
+                    print(str(datetime.datetime.now()) + " Error: no response to command "+hex(packet[0])+
+                          ", not sent again")
+                    return None
+
                 # Resend the command
                 if(print_cmd):
-                    print(str(datetime.datetime.now()) + " >", packet)
-                self.serial_port.write(bytearray.fromhex(packet))
+                    print(str(datetime.datetime.now()) + " >", bytes(packet).hex().upper())
+                sent = perf_counter()
+                self.serial_port.write(packet)
                 status_evt = self.wait_event(print_evt = print_cmd)
 
                 # Retry if there is an error
@@ -216,113 +562,473 @@ class HCI:
                 if(retryCount == 0):
                     return None
 
+            self.update_rtt(perf_counter() - sent)
             return status_evt
 
+    ## Prepare a command.
+     #
+     # Returns seq, data. With the framing the command gets the next sequence
+     # number and is kept for retransmission until its event arrives, without
+     # the framing seq is None and data is the packet.
+    ################################################################################
+    def command(self, packet):
+        if(not self.framing):
+            return None, packet
+
+        seq = self.seq
+        self.seq = (self.seq + 1) & 0xFF
+        self.inflight[seq] = bytes(packet)
+        return seq, frame_packet(seq, packet)
+
+    ## Receive the next frame.
+     #
+     # Resyncs on the next sync byte after garbage or a corrupted frame.
+     # Returns seq, status_evt, or None, None if nothing valid arrives before
+     # the deadline.
+    ################################################################################
+    def read_frame(self, deadline):
+        while(True):
+            consumed, seq, packet = unframe(self.rx)
+            if(consumed):
+                del self.rx[:consumed]
+                if(packet and event_length(packet) == len(packet)):
+                    return seq, parse_event(packet)
+                continue
+
+            if(perf_counter() >= deadline):
+                return None, None
+            self.rx += self.serial_port.read(size=max(1, self.serial_port.in_waiting))
+
+    ## Wait for the event of a framed command.
+     #
+     # Events of other commands in flight are kept for later, events of
+     # commands already completed are duplicates and dropped. Devices handle the
+     # commands in sequence order, so the event of a later command means the
+     # event being waited for was lost. Returns None on a timeout or a loss.
+    ################################################################################
+    def wait_frame(self, seq, timeout, gap = True):
+        if(seq in self.early):
+            return self.early.pop(seq)
+
+        self.set_timeout(timeout)
+        deadline = perf_counter() + timeout
+        while(True):
+            rseq, status_evt = self.read_frame(deadline)
+            if(status_evt == None):
+                return None
+
+            if(rseq == seq):
+                return status_evt
+
+            if(rseq in self.inflight):
+                self.early[rseq] = status_evt
+                if(gap):
+                    return None
+
+    ## Complete a framed command.
+     #
+     # Waits for the event of the command with sequence number seq and
+     # retransmits only that command if the event is lost or corrupted. The
+     # device answers a command it has already handled from its cache, so a
+     # retransmission doesn't run the codec twice. Returns the event or None.
+    ################################################################################
+    def transact(self, seq, print_evt = False, retryCount = 10):
+        for attempt in range(retryCount):
+            status_evt = self.wait_frame(seq, self.response_timeout(), gap = (attempt == 0))
+            if(status_evt != None):
+                del self.inflight[seq]
+                if(print_evt):
+                    print(str(datetime.datetime.now()) + " <", status_evt.evt, status_evt.status, bytes(status_evt.payload).hex().upper())
+                return status_evt
+
+            print(str(datetime.datetime.now()) + " Retransmitting command "+str(seq))
+            self.serial_port.write(frame_packet(seq, self.inflight[seq]))
+
+        del self.inflight[seq]
+        return None
+
+    ## Enable the framing.
+     #
+     # Devices with capabilities version 2 or later accept framed commands and
+     # answer them with framed events. A framed capabilities command starts the
+     # sequence on the device, it is retransmitted like the other framed
+     # commands and its event is checked by the CRC, so it also confirms the
+     # negotiated capabilities. Returns False if the device doesn't support the
+     # framing or didn't confirm it.
+    ################################################################################
+    def enable_framing(self):
+        if(self.framing):
+            return True
+
+        self.negotiate()
+        if(self.version == None):
+            print("Error: no capabilities event, can't enable the framing")
+            return False
+
+        if(self.version < FRAMING_VERSION):
+            print("Error: device doesn't support framing")
+            return False
+
+        self.framing = True
+        self.seq = 0
+        self.inflight.clear()
+        self.early.clear()
+        self.rx.clear()
+
+        status_evt = self.send_command(bytes([CMD_CAPABILITIES]), print_cmd = False)
+        if(status_evt == None or status_evt.evt != EVT_CAPABILITIES):
+            print("Error enabling framing")
+            self.framing = False
+            self.drain()
+            return False
+
+        self.version, max_batch = CAPS_STRUCT.unpack(status_evt.payload)
+        self.max_batch = min(max(max_batch, 1), MAX_BATCH)
+
+        print("Framing enabled")
+        return True
+
+    ## Disable the framing.
+     #
+     # Later commands are sent without the framing, devices that support the
+     # framing also accept unframed commands. Events still in flight are
+     # discarded.
+    ################################################################################
+    def disable_framing(self):
+        if(not self.framing):
+            return
+
+        self.framing = False
+        self.inflight.clear()
+        self.early.clear()
+        self.rx.clear()
+        self.drain()
+
+    ## Receive the event of a command.
+     #
+     # seq is the sequence number with the framing, events arrive in order
+     # without it.
+    ################################################################################
+    def receive(self, seq):
+        if(self.framing):
+            return self.transact(seq)
+
+        return self.wait_event(print_evt = False)
+
+    ## Get the execution time.
+     #
+     # Queries the cycle count of the last encoded or decoded frame.
+    ################################################################################
+    def exec_time(self):
+        roundTrip = self.round_trip
+        status_evt = self.send_command(bytes([CMD_EXEC_TIME]), print_cmd=False)
+
+        # Keep the response time of the frame
+        self.round_trip = roundTrip
+        return exec_time_result(status_evt)
+
+    ## Negotiate the batch commands.
+     #
+     # Sends the capabilities command until two capabilities events agree, after
+     # draining the line. Devices that support the batch commands answer with
+     # the capabilities event, other devices don't answer or send a status
+     # event, then frames are sent one per command. An event with an unknown
+     # version or no frames is ignored, the maximum is clamped to MAX_BATCH.
+     # Returns the maximum number of frames per batch, 1 without batch support
+     # or if the device didn't answer.
+    ################################################################################
+    def negotiate(self):
+        if(self.max_batch != None):
+            return self.max_batch
+
+        caps = None
+        for attempt in range(NEGOTIATE_ATTEMPTS):
+            self.drain()
+            self.serial_port.write(bytes([CMD_CAPABILITIES]))
+            status_evt = self.wait_event(print_evt = False, timeout = NEGOTIATE_TIMEOUT)
+            if(status_evt == None):
+                continue
+
+            if(status_evt.evt != EVT_CAPABILITIES):
+                self.drain()
+                self.max_batch = 1
+                self.version = 0
+                break
+
+            version, max_batch = CAPS_STRUCT.unpack(status_evt.payload)
+            if(version < 1 or version > FRAMING_VERSION or max_batch < 1):
+                print("Error: invalid capabilities event "+bytes(status_evt.payload).hex().upper())
+                caps = None
+                continue
+
+            if(caps == (version, max_batch)):
+                self.version, self.max_batch = version, min(max_batch, MAX_BATCH)
+                break
+            caps = (version, max_batch)
+
+        if(self.max_batch == None):
+            print("Error: no capabilities event, sending one frame per command")
+            self.drain()
+            self.max_batch = 1
+            return self.max_batch
+
+        print("Max frames per batch:", self.max_batch)
+        return self.max_batch
+
+    ## Forget a failed negotiation.
+     #
+     # A device that didn't answer the capabilities command is asked again by
+     # the next negotiate(), the capabilities of a device that answered are
+     # kept.
+    ################################################################################
+    def reset_negotiation(self):
+        if(self.version == None):
+            self.max_batch = None
+
+    ## Check that the encoder and the decoder run side by side.
+     #
+     # The encode and decode session needs a device that keeps an encoder and
+     # a decoder instance at the same time. Two probe frames are encoded and
+     # decoded alternately after initializing both, the results must match
+     # the encoder and then the decoder used alone. The answer is remembered,
+     # unless a command failed with the encoder or the decoder alone, the
+     # check is then tried again next time. Leaves the codecs in an unknown
+     # state, initialize them again afterwards. Returns True if the instances
+     # are separate.
+    ################################################################################
+    def check_codecs(self, frame_len, sample_rate, bitrate):
+        if(self.separate_codecs != None):
+            return self.separate_codecs
+
+        frameSamples = int(int(sample_rate)*float(frame_len)/1000)
+        probes = [array("h", ((i*p*331) % 8192 - 4096 for i in range(frameSamples))).tobytes() for p in (1, 2)]
+
+        # The encoder and then the decoder alone
+        alone = None
+        if(self.init_encoder(frame_len, sample_rate, bitrate)):
+            encoded = [self.encode(probe, False)[0] for probe in probes]
+            if(None not in encoded and self.init_decoder(frame_len, sample_rate, bitrate)):
+                alone = encoded + [self.decode(frame[LENGTH_STRUCT.size:], False)[0] for frame in encoded]
+
+        if(alone == None or None in alone):
+            print("Error: can't check the encoder and decoder instances")
+            return False
+
+        # Both, used alternately, a failed command means they aren't separate
+        both = None
+        if(self.init_encoder(frame_len, sample_rate, bitrate) and self.init_decoder(frame_len, sample_rate, bitrate)):
+            encoded = []
+            decoded = []
+            for probe in probes:
+                encoded.append(self.encode(probe, False)[0])
+                decoded.append(self.decode(encoded[-1][LENGTH_STRUCT.size:], False)[0] if encoded[-1] != None else None)
+            both = encoded + decoded
+
+        self.separate_codecs = both == alone
+        if(not self.separate_codecs):
+            print("The device doesn't keep the encoder and decoder apart")
+        return self.separate_codecs
+
+    ## Get the number of frames per command.
+     #
+     # batch clamped to the maximum negotiated with the device, 1 if the device
+     # doesn't support the batch commands.
+    ################################################################################
+    def frames_per_command(self, batch):
+        if(batch > 1):
+            return min(batch, self.negotiate())
+
+        return 1
 
     def init_encoder(self, frame_len, sample_rate, bitrate):
         print("Initializing encoder")
 
         # Send the command to initialize the encoder
-        frame_len_str = self.parseIntHexString(frame_len, 2)
-        sample_rate_str = self.parseIntHexString(sample_rate, 4)
-        bitrate_str = self.parseIntHexString(bitrate, 8)
-
-        status_evt = self.send_command("01"+frame_len_str+sample_rate_str+bitrate_str)
+        status_evt = self.send_command(INIT_STRUCT.pack(CMD_INIT_ENCODER, frame_duration_code(frame_len), int(sample_rate), int(bitrate)))
 
         # Return the status
-        if("0600" not in status_evt):
+        if(status_evt == None or status_evt.evt != EVT_STATUS or status_evt.status != 0):
             print("Error initializing encoder")
             return False
 
         return True
 
-    def encode(self, samples):
+    def encode(self, samples, exec_time = True):
 
         # Send the command to encode the samples
-        samplesHexString = samples.hex()
-        status_evt = self.send_command("02"+samplesHexString, print_cmd=False)
+        status_evt = self.send_command(bytes([CMD_ENCODE]) + samples, print_cmd=False)
 
         # Check the error code
-        if(status_evt[:4] != "0700"):
-            return None
-
-        # Get the number of bytes
-        byteCount0 = int(status_evt[4:6],16)
-        byteCount1 = int(status_evt[6:8],16)
-
-        # Write the number of bytes at the start of the frame
-        frameBytes = bytearray()
-        frameBytes.append(byteCount0)
-        frameBytes.append(byteCount1)
-        byteCount = byteCount0 + (byteCount1 << 8)
-
-        # Split the frame into bytes
-        chunks, chunk_size = byteCount*2, 2
-        frameBytesString = [ status_evt[8:][i:i+chunk_size] for i in range(0, chunks, chunk_size) ]
-
-        # Convert data from string to bytes
-        for byte in frameBytesString:
-            frameBytes.append(int(byte,16))
+        frameBytes = encode_result(status_evt)
+        if(frameBytes == None):
+            return None, None
 
         # Get the execution time
-        status_evt = self.send_command("05", print_cmd=False)
-
-        # Convert the time to an integer
-        execTimeString = status_evt[8:10] + status_evt[6:8] + status_evt[4:6] + status_evt[2:4]
-        execTime = int(execTimeString, 16)
+        execTime = self.exec_time() if exec_time else None
 
         # Return the encoded data
         return frameBytes, execTime
-    
+
+    ## Encode a sequence of frames.
+     #
+     # Yields frameBytes, execTime for each frame in order. With a window of 1
+     # every frame waits for its event, larger windows pipeline the commands.
+     # The execution time is queried according to the profile policy, execTime
+     # is None for frames that aren't profiled.
+     #
+     # With a batch size above 1 and a device that supports the batch commands,
+     # up to batch frames are sent per command. The profile policy then counts
+     # batches and execTime is the mean of the frames in the batch. first is
+     # the index of the first frame or batch for the profile policy, for a
+     # sequence sent in several calls.
+    ################################################################################
+    def encode_frames(self, frames, window = 1, profile = 1, batch = 1, first = 0):
+        perCommand = self.frames_per_command(batch)
+        if(perCommand > 1):
+            packets = map(batch_encode_packet, batches(frames, perCommand))
+            for status_evt, execTime in self.pipeline(packets, window, profile, first):
+                results = batch_encode_results(status_evt)
+                if(results == None):
+                    yield None, None
+                    return
+
+                for frameBytes in results:
+                    yield frameBytes, execTime//len(results) if execTime != None else None
+            return
+
+        if(window <= 1):
+            for index, frame in enumerate(frames, first):
+                yield self.encode(frame, profile_frame(index, profile))
+            return
+
+        cmd = bytes([CMD_ENCODE])
+        for status_evt, execTime in self.pipeline((cmd + frame for frame in frames), window, profile, first):
+            yield encode_result(status_evt), execTime
+
     def init_decoder(self, frame_len, sample_rate, bitrate):
         print("Initializing decoder")
 
-        # Send the command to initialize the encoder
-        frame_len_str = self.parseIntHexString(frame_len, 2)
-        sample_rate_str = self.parseIntHexString(sample_rate, 4)
-        bitrate_str = self.parseIntHexString(bitrate, 8)
-
-        status_evt = self.send_command("03"+frame_len_str+sample_rate_str+bitrate_str)
+        # Send the command to initialize the decoder
+        status_evt = self.send_command(INIT_STRUCT.pack(CMD_INIT_DECODER, frame_duration_code(frame_len), int(sample_rate), int(bitrate)))
 
         # Return the status
-        if("0600" not in status_evt):
+        if(status_evt == None or status_evt.evt != EVT_STATUS or status_evt.status != 0):
             print("Error initializing decoder")
             return False
 
         return True
 
-    def decode(self, data):
+    def decode(self, data, exec_time = True):
 
-        # Send the command to encode the samples
-        dataHexString = data.hex()
-        status_evt = self.send_command("04"+dataHexString, print_cmd=False)
+        # Send the command to decode the frame
+        status_evt = self.send_command(bytes([CMD_DECODE]) + data, print_cmd=False)
 
         # Check the error code
-        if(status_evt[:4] != "0800"):
-            return None
-
-        # Get the number of samples
-        sampleCount0 = int(status_evt[4:6],16)
-        sampleCount1 = int(status_evt[6:8],16)
-
-        sampleCount = sampleCount0 + (sampleCount1 << 8)
-
-        # Split the frame into samples
-        chunks, chunk_size = sampleCount*4, 4
-        frameSampleString = [ status_evt[8:][i:i+chunk_size] for i in range(0, chunks, chunk_size) ]
-
-        # Convert data from string to bytes
-        frameSamples = bytearray()
-        for sample in frameSampleString:
-            frameSamples.append(int(sample[:2],16))
-            frameSamples.append(int(sample[2:],16))
+        frameSamples = decode_result(status_evt)
+        if(frameSamples == None):
+            return None, None
 
         # Get the execution time
-        status_evt = self.send_command("05", print_cmd=False)
+        execTime = self.exec_time() if exec_time else None
 
-        # Convert the time to an integer
-        execTimeString = status_evt[8:10] + status_evt[6:8] + status_evt[4:6] + status_evt[2:4]
-        execTime = int(execTimeString, 16)
+        # Return the decoded samples
+        return frameSamples, execTime
 
-        # Return the encoded data
-        return frameSamples, execTime
\ No newline at end of file
+    ## Decode a sequence of frames.
+     #
+     # Yields frameSamples, execTime for each frame in order. With a window of 1
+     # every frame waits for its event, larger windows pipeline the commands.
+     # The execution time is queried according to the profile policy, execTime
+     # is None for frames that aren't profiled.
+     #
+     # With a batch size above 1 and a device that supports the batch commands,
+     # up to batch frames are sent per command. The profile policy then counts
+     # batches and execTime is the mean of the frames in the batch. first is
+     # the index of the first frame or batch for the profile policy, for a
+     # sequence sent in several calls.
+    ################################################################################
+    def decode_frames(self, frames, window = 1, profile = 1, batch = 1, first = 0):
+        perCommand = self.frames_per_command(batch)
+        if(perCommand > 1):
+            packets = map(batch_decode_packet, batches(frames, perCommand))
+            for status_evt, execTime in self.pipeline(packets, window, profile, first):
+                results = batch_decode_results(status_evt)
+                if(results == None):
+                    yield None, None
+                    return
+
+                for frameSamples in results:
+                    yield frameSamples, execTime//len(results) if execTime != None else None
+            return
+
+        if(window <= 1):
+            for index, frame in enumerate(frames, first):
+                yield self.decode(frame, profile_frame(index, profile))
+            return
+
+        cmd = bytes([CMD_DECODE])
+        for status_evt, execTime in self.pipeline((cmd + frame for frame in frames), window, profile, first):
+            yield decode_result(status_evt), execTime
+
+    ## Pipeline frame commands.
+     #
+     # Keeps up to window frame or batch commands in flight. Each profiled
+     # command is followed by the execution time command, the controller
+     # handles commands in order so the events are matched back to the commands
+     # in the order they were sent. Yields status_evt, execTime for each command.
+     # Without the framing a lost event can't be retried once later commands
+     # have been processed, so the generator yields None, None and stops on the
+     # first error. With the framing only the affected command is retransmitted.
+    ################################################################################
+    def pipeline(self, packets, window, profile = 1, first = 0):
+        execCmd = bytes([CMD_EXEC_TIME])
+        pending = deque()
+
+        for index, packet in enumerate(packets, first):
+            profiled = profile_frame(index, profile)
+            seq, data = self.command(packet)
+            execSeq = None
+            if(profiled):
+                execSeq, execData = self.command(execCmd)
+                data += execData
+            self.serial_port.write(data)
+            pending.append((index, perf_counter(), seq, execSeq, profiled))
+
+            if(len(pending) < window):
+                continue
+
+            result = self.pipeline_result(*pending.popleft())
+            yield result
+            if(result[0] == None):
+                return
+
+        while(pending):
+            result = self.pipeline_result(*pending.popleft())
+            yield result
+            if(result[0] == None):
+                return
+
+    ## Receive the events for one pipelined frame.
+     #
+     # The response time is measured from when the frame was sent or the
+     # previous frame completed, whichever is later, so the time spent queued
+     # behind other frames doesn't inflate the timeout.
+    ################################################################################
+    def pipeline_result(self, index, sent, seq, execSeq, profiled):
+        start = max(sent, self.last_result)
+        status_evt = self.receive(seq)
+        if(status_evt == None):
+            print(str(datetime.datetime.now()) + " Error: no response for frame "+str(index))
+            return None, None
+
+        execTime = None
+        if(profiled):
+            execTime = exec_time_result(self.receive(execSeq))
+            if(execTime == None):
+                print(str(datetime.datetime.now()) + " Error: no execution time for frame "+str(index))
+                return None, None
+
+        self.last_result = perf_counter()
+        self.update_rtt(self.last_result - start)
+
+        return status_evt, execTime
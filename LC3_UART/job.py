@@ -0,0 +1,157 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+## job.py
+ #
+ # Run an LC3.py job on a device
+ #
+
+import wave
+from encoder import Encoder
+from decoder import Decoder
+from roundtrip import RoundTrip
+from checkpoint import PRIME_FRAMES
+from bitstream import is_stdio, read_bin_header
+
+## Get the number of channels of a job.
+ #
+ # Reads the header of the input file, the standard input counts as one
+ # channel.
+################################################################################
+def job_channels(job):
+    if(job.get("INPUT") == None or is_stdio(job["INPUT"])):
+        return 1
+
+    try:
+        if(job["command"] in ["E", "ED"]):
+            with wave.open(job["INPUT"], 'rb') as input_wav:
+                return input_wav.getnchannels()
+
+        with open(job["INPUT"], 'rb') as input_bin:
+            header = read_bin_header(input_bin)
+            return header.channels if header != None else 1
+    except (OSError, EOFError, wave.Error):
+        return 1
+
+## Get the number of devices a job can use.
+ #
+ # A device per channel, or per segment of a mono file.
+################################################################################
+def job_devices(job):
+    channels = job_channels(job)
+    if(channels == 1 and job["command"] == "D"):
+        return max(job.get("segments", 1), 1)
+    return channels
+
+## Run a job.
+ #
+ # job is a dictionary with the LC3.py command line arguments, returns the
+ # exit code of the job. devices are more HCIs for the channels of a
+ # multichannel job. The framing is only enabled for the job, the next job on
+ # the same devices starts without it, a job with the framing fails if a
+ # device can't confirm it. A batch negotiation the devices didn't answer is
+ # tried again.
+################################################################################
+def run_job(hci, job, devices=[]):
+    for device in [hci] + list(devices):
+        device.reset_negotiation()
+
+    framed = []
+    try:
+        if(job.get("framing")):
+            for device in [hci] + list(devices):
+                framed.append(device)
+                if(not device.enable_framing()):
+                    return 1
+
+        return run_command(hci, job, devices)
+    finally:
+        for device in framed:
+            device.disable_framing()
+
+## Run the command of a job.
+################################################################################
+def run_command(hci, job, devices):
+    if(job["command"] == "E"):
+        print("Encoding")
+        return Encoder.encode(hci, job["INPUT"], job["OUTPUT"], job["BITRATE"], job["frame_ms"],
+                              job["window"], job["profile"], job.get("batch", 1), job.get("resume", False),
+                              job.get("log"), devices, job.get("realtime", False), job.get("deadline"))
+
+    if(job["command"] == "D"):
+        print("Decoding")
+        segment = None
+        if(job.get("start") or job.get("frames") != None):
+            start = job.get("start") or 0
+            segment = (start, start + job["frames"] if job.get("frames") != None else None)
+        return Decoder.decode(hci, job["INPUT"], job["OUTPUT"], job["window"], job["profile"],
+                              job.get("batch", 1), job.get("resume", False), job.get("log"), devices,
+                              segment, job.get("prime", PRIME_FRAMES), job.get("segments", 1),
+                              job.get("index", False), job.get("realtime", False), job.get("deadline"))
+
+    if(job["command"] == "ED"):
+        print("Encoding and decoding")
+        return RoundTrip.encdec(hci, job["INPUT"], job["BIN"], job["OUTPUT"], job["BITRATE"], job["frame_ms"],
+                                job["window"], job["profile"], job.get("batch", 1), job.get("log"), devices,
+                                job.get("realtime", False), job.get("deadline"))
+
+    print("Unknown command "+str(job["command"]))
+    return 1
+
+## Run the jobs of a manifest.
+ #
+ # The jobs run one after the other on the same devices, the port, the lock
+ # and the negotiated capabilities are kept. Returns the number of failed jobs.
+################################################################################
+def run_jobs(hci, jobs, devices=[]):
+    failed = []
+    for number, job in enumerate(jobs, 1):
+        print("\nJob", str(number)+"/"+str(len(jobs))+":", job["command"], job["INPUT"], job["OUTPUT"])
+        try:
+            retval = run_job(hci, job, devices)
+        except (OSError, EOFError, wave.Error) as err:
+            print("Error: "+str(err))
+            retval = 1
+
+        if(retval != 0):
+            failed.append(number)
+
+    print("\nJobs:", len(jobs), "failed:", len(failed))
+    for number in failed:
+        print("Failed job", number, jobs[number - 1]["INPUT"])
+
+    return len(failed)
+
+### ------------------------------------------------------------------------ ###
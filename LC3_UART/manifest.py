@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+
+## manifest.py
+ #
+ # Job manifests, lists of LC3.py jobs run in one process
+ #
+
+import csv
+import json
+from bitstream import STDIO
+
+# Manifest columns and the job keys they set
+MANIFEST_KEYS = {
+    "command"  : "command",
+    "input"    : "INPUT",
+    "output"   : "OUTPUT",
+    "bin"      : "BIN",
+    "bitrate"  : "BITRATE",
+    "frame_ms" : "frame_ms",
+    "log"      : "log",
+    "start"    : "start",
+    "frames"   : "frames",
+    "prime"    : "prime",
+    "segments" : "segments",
+}
+
+# Manifest columns with integer values
+MANIFEST_INTS = ["start", "frames", "prime", "segments"]
+
+## Read a job manifest.
+ #
+ # The manifest is a JSON list of objects, or a CSV file with a header row,
+ # with the MANIFEST_KEYS of each job. Empty values are left out. defaults
+ # has the LC3.py options shared by the jobs. Returns a list of jobs, raises
+ # ValueError on an invalid manifest.
+################################################################################
+def read_manifest(path, defaults):
+    with open(path, newline='') as f:
+        if(path.lower().endswith(".csv")):
+            entries = list(csv.DictReader(f))
+        else:
+            entries = json.load(f)
+
+    if(not isinstance(entries, list)):
+        raise ValueError("The manifest must be a list of jobs")
+
+    jobs = []
+    for number, entry in enumerate(entries, 1):
+        if(not isinstance(entry, dict)):
+            raise ValueError("Job "+str(number)+" isn't an object")
+
+        job = dict(defaults)
+        for key, value in entry.items():
+            key = key.strip().lower()
+            if(key not in MANIFEST_KEYS):
+                raise ValueError("Unknown key "+key+" in job "+str(number))
+            if(value == None or str(value).strip() == ""):
+                continue
+            value = str(value).strip() if not isinstance(value, (int, float)) else value
+            job[MANIFEST_KEYS[key]] = int(value) if key in MANIFEST_INTS else value
+
+        if(STDIO in [job.get("INPUT"), job.get("OUTPUT"), job.get("BIN")]):
+            raise ValueError("The standard input and output can't be used in job "+str(number))
+
+        job["command"] = str(job.get("command", "")).upper()
+        required = {"E" : ["INPUT", "OUTPUT", "BITRATE"], "D" : ["INPUT", "OUTPUT"],
+                    "ED" : ["INPUT", "BIN", "OUTPUT", "BITRATE"]}
+        if(job["command"] not in required):
+            raise ValueError("Unknown command "+job["command"]+" in job "+str(number))
+        for key in required[job["command"]]:
+            if(job.get(key) == None):
+                raise ValueError("Missing "+key.lower()+" in job "+str(number))
+        job.setdefault("frame_ms", "10")
+        jobs.append(job)
+
+    return jobs
+
+### ------------------------------------------------------------------------ ###
@@ -0,0 +1,158 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+## pool.py
+ #
+ # Pool of LC3 devices shared between processes with per-device lock files
+ #
+
+import os
+import re
+import fcntl
+import serial
+from time import sleep
+
+# Time to wait before polling the devices again when all of them are busy
+POLL_INTERVAL = 0.02
+
+## Parse a list of serial ports.
+ #
+ # Ports are separated by commas, e.g. "/dev/ttyUSB0,/dev/ttyUSB1".
+################################################################################
+def parse_ports(ports):
+    return [port.strip() for port in str(ports).split(",") if port.strip()]
+
+## Open a serial port.
+ #
+ # Serial port is configured as 8N1, no flow control.
+################################################################################
+def open_serial(port, baud):
+    port = serial.Serial(
+        port=str(port),
+        baudrate=baud,
+        parity=serial.PARITY_NONE,
+        stopbits=serial.STOPBITS_ONE,
+        bytesize=serial.EIGHTBITS,
+        rtscts=False,
+        dsrdtr=False,
+        timeout=1.0
+    )
+    port.isOpen()
+    return port
+
+class DevicePool:
+
+    def __init__(self, ports, lockdir="."):
+        self.ports = ports
+        self.lockdir = lockdir
+
+    ## Get the lock file name of a port.
+    ################################################################################
+    def lockfile_name(self, port):
+        name = re.sub(r"[^A-Za-z0-9]+", "_", port).strip("_")
+        return os.path.join(self.lockdir, "serial_lockfile_"+name+".txt")
+
+    ## Lock a port.
+     #
+     # Returns the open lock file. If blocking is False, returns None when
+     # another process holds the lock.
+    ################################################################################
+    def lock(self, port, blocking=False):
+        lockfile = open(self.lockfile_name(port), 'a+')
+        try:
+            fcntl.lockf(lockfile, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lockfile.close()
+            return None
+
+        # Write the PID to the file
+        lockfile.truncate(0)
+        lockfile.write(str(os.getpid())+"\n")
+        lockfile.flush()
+
+        return lockfile
+
+    ## Acquire a free device.
+     #
+     # Polls the devices until one of them is free and returns the port name and
+     # the lock file. Processes start polling at different devices so the jobs
+     # spread over the pool.
+    ################################################################################
+    def acquire(self):
+        start = os.getpid() % len(self.ports)
+        order = self.ports[start:] + self.ports[:start]
+
+        while(True):
+            for port in order:
+                lockfile = self.lock(port)
+                if(lockfile != None):
+                    return port, lockfile
+
+            sleep(POLL_INTERVAL)
+
+    ## Acquire more free devices.
+     #
+     # Locks up to count devices that are free now, without waiting. exclude
+     # lists the ports this process already holds, the lock files don't
+     # exclude the process holding them. Returns a list of port names and lock
+     # files.
+    ################################################################################
+    def acquire_free(self, count, exclude=[]):
+        devices = []
+        for port in self.ports:
+            if(len(devices) >= count):
+                break
+
+            if(port in exclude):
+                continue
+
+            lockfile = self.lock(port)
+            if(lockfile != None):
+                devices.append((port, lockfile))
+
+        return devices
+
+    ## Release a device.
+     #
+     # Clears the PID, the lock file is kept because other processes may have
+     # it open and be waiting on it.
+    ################################################################################
+    def release(self, lockfile):
+        lockfile.truncate(0)
+        lockfile.flush()
+        fcntl.lockf(lockfile, fcntl.LOCK_UN)
+        lockfile.close()
+
+### ------------------------------------------------------------------------ ###
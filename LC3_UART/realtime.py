@@ -0,0 +1,110 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+
+## realtime.py
+ #
+ # Real-time pacing of the frames with deadline accounting
+ #
+
+from collections import deque
+from time import perf_counter, sleep
+from stats import print_summary
+
+## Real-time pacer.
+ #
+ # Releases the frames at the frame interval, as a live source would, and
+ # measures the latency from the release of each frame to its result. A
+ # frame misses its deadline if the latency is above deadline_ms, one frame
+ # interval by default. Frames released late because the device fell behind
+ # still count from their scheduled time.
+################################################################################
+class Pacer:
+
+    def __init__(self, frame_ms, deadline_ms = None):
+        self.interval = float(frame_ms)/1000
+        self.deadline = float(deadline_ms)/1000 if deadline_ms != None else self.interval
+        self.start = None
+        self.releases = deque()
+        self.latencies = []
+        self.misses = 0
+
+    ## Yield the frames at the frame interval.
+    ################################################################################
+    def pace(self, frames):
+        for index, frame in enumerate(frames):
+            if(self.start == None):
+                self.start = perf_counter()
+
+            release = self.start + index*self.interval
+            delay = release - perf_counter()
+            if(delay > 0):
+                sleep(delay)
+
+            self.releases.append(release)
+            yield frame
+
+    ## Record the result of the oldest frame in flight.
+     #
+     # Returns the latency in seconds.
+    ################################################################################
+    def result(self):
+        latency = perf_counter() - self.releases.popleft()
+        self.latencies.append(latency*1000)
+        if(latency > self.deadline):
+            self.misses += 1
+
+        return latency
+
+    ## Get the jitter in ms.
+     #
+     # The mean absolute difference of the latencies of consecutive frames.
+    ################################################################################
+    def jitter(self):
+        if(len(self.latencies) < 2):
+            return 0.0
+
+        return sum(abs(b - a) for a, b in zip(self.latencies, self.latencies[1:]))/(len(self.latencies) - 1)
+
+    ## Print the latency summary and the deadline misses.
+    ################################################################################
+    def print_summary(self, title):
+        print_summary(title, self.latencies, "ms")
+        count = len(self.latencies)
+        print("  Deadline     : %.1f ms" % (self.deadline*1000))
+        print("  Misses       : %d (%.1f%%)" % (self.misses, 100.0*self.misses/count if count else 0))
+        print("  Jitter       : %.3f ms" % self.jitter())
+
+### ------------------------------------------------------------------------ ###
@@ -0,0 +1,247 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+
+## roundtrip.py
+ #
+ # LC3 encoder and decoder round trip wrapper
+ #
+
+import wave
+from hci import HCI, LENGTH_STRUCT
+from stats import print_summary, print_rtf
+from framelog import FrameLog
+from time import perf_counter
+from bitstream import is_stdio, open_input, open_output, wav_frames, \
+    write_bin_header
+from channels import interleave_channels, run_channels, split_channels
+from realtime import Pacer
+from itertools import islice
+import os
+
+class RoundTrip:
+
+    def __init__(self):
+        pass
+
+    ## Encode a wav file and decode the encoded frames in the same session.
+     #
+     # Writes the encoded frames to the bin output and the decoded samples to
+     # the wav output, so the bin file isn't sent to the device again. Frames
+     # are encoded and decoded in chunks of max(window, batch) frames. A device
+     # that can't keep an encoder and a decoder at the same time encodes the
+     # whole channel first, then decodes it.
+     # devices are more HCIs for the channels of a multichannel file. realtime
+     # sends the frames at the frame interval and counts the results later
+     # than deadline ms, one frame interval by default.
+    ################################################################################
+    def encdec(hci, input, bin_output, output, bitrate, frame_len=10, window=1, profile=1, batch=1, log=None,
+               devices=[], realtime=False, deadline=None):
+        print("\nEncoder and decoder")
+
+        if(is_stdio(bin_output) and is_stdio(output)):
+            print("Error: only one output can be the standard output")
+            return 1
+
+        # Parse the wave file, the samples are read frame by frame
+        input_file = open_input(input)
+        input_wav = output_bin = output_file = output_wav = frameLog = None
+        try:
+            input_wav = wave.open(input_file, 'rb')
+
+            nchannels = input_wav.getnchannels()
+            samplewidth = input_wav.getsampwidth()
+            framerate = input_wav.getframerate()
+            nframes = input_wav.getnframes()
+
+            frame_samples = int(framerate*(float(frame_len)/1000))
+            frame_count = int(nframes / frame_samples)
+
+            print("Channels     :", nchannels)
+            print("Sample width :", samplewidth)
+            print("Sample Rate  :", framerate)
+            print("Samples      :", nframes)
+            print("Frame Len    :", frame_len)
+            print("Bitrate      :", bitrate)
+            print("Frame samples:", frame_samples)
+            print("Frame count  :", frame_count)
+            print("Window       :", window)
+            print("Profile      :", profile)
+            print("Batch        :", batch)
+
+            if(samplewidth != 2):
+                print("Error: only 16 bit samples are supported")
+                return 1
+
+            # One device per channel at most
+            hcis = ([hci] + list(devices))[:nchannels]
+            print("Devices      :", len(hcis))
+
+            # The encoder and the decoder of a channel run on the same device. A
+            # device that doesn't keep them apart, or can't be checked, encodes
+            # all the frames of the channel and then decodes them.
+            channelBitrate = int(bitrate)//nchannels
+            separate = {device: device.check_codecs(frame_len, framerate, channelBitrate) for device in hcis}
+            def init(device):
+                return device.init_encoder(frame_len, framerate, channelBitrate) and \
+                    (not separate[device] or device.init_decoder(frame_len, framerate, channelBitrate))
+
+            for device in hcis:
+                if(not init(device)):
+                    return 1
+
+            # Yields the encoded and the decoded frame and their execution times
+            def run(device, channel, channelFrames):
+                if(channel >= len(hcis) and not init(device)):
+                    yield None, None
+                    return
+
+                # The profile policy counts the frames or batches of the whole
+                # sequence, not of each chunk
+                channelFrames = iter(channelFrames)
+                perCommand = device.frames_per_command(batch)
+                chunkFrames = max(window, batch, 1) if separate[device] else None
+                first = 0
+                while(True):
+                    chunk = list(islice(channelFrames, chunkFrames))
+                    if(len(chunk) == 0):
+                        return
+
+                    encoded = list(device.encode_frames(chunk, window, profile, batch, first))
+                    if(any(encoded_frame == None for encoded_frame, execTime in encoded) or
+                       (not separate[device] and not device.init_decoder(frame_len, framerate, channelBitrate))):
+                        yield None, None
+                        return
+
+                    decoded = device.decode_frames([encoded_frame[LENGTH_STRUCT.size:] for encoded_frame, execTime in encoded],
+                                                   window, profile, batch, first)
+                    first += (len(chunk) + perCommand - 1)//perCommand
+                    for (encoded_frame, encodeTime), (decodedSamples, decodeTime) in zip(encoded, decoded):
+                        if(decodedSamples == None):
+                            yield None, None
+                            return
+                        yield (encoded_frame, decodedSamples), (encodeTime, decodeTime)
+
+            frames = (split_channels(frame, nchannels) for frame in wav_frames(input_wav, frame_samples))
+            pacer = Pacer(frame_len, deadline) if realtime else None
+            if(pacer != None):
+                frames = pacer.pace(frames)
+
+            # Setup the output files. The wav file has the samples of every
+            # frame, the last one is padded. The header can't be updated on a
+            # pipe, so the length is set first, whatever the output.
+            output_bin = open_output(bin_output)
+            write_bin_header(output_bin, framerate, bitrate, nchannels, frame_len, nframes)
+
+            output_file = open_output(output)
+            output_wav = wave.open(output_file, 'wb')
+            decodedFrames = -(-nframes//frame_samples)*frame_samples
+            remaining = decodedFrames*nchannels*2
+
+            output_wav.setnchannels(nchannels)
+            output_wav.setsampwidth(2)
+            output_wav.setframerate(framerate)
+            output_wav.setnframes(decodedFrames)
+
+            # Save the encoded frames and the decoded samples
+            encodeTimes = []
+            decodeTimes = []
+            frameLog = FrameLog(log)
+            count = 0
+            wall = perf_counter()
+            results = run_channels(hcis, nchannels, frames, run)
+            for index, channelResults in enumerate(results):
+
+                if(any(result == None for result, execTime, roundTrip in channelResults)):
+                    print("Error encoding or decoding frame")
+                    return 1
+
+                latency = pacer.result() if pacer != None else None
+
+                # The log has the encoded bytes and the execution time of the
+                # encode and decode of each frame
+                for (encoded_frame, decodedSamples), (encodeTime, decodeTime), roundTrip in channelResults:
+                    output_bin.write(encoded_frame)
+                    execTime = encodeTime + decodeTime if encodeTime != None and decodeTime != None else None
+                    frameLog.record(index, len(encoded_frame) - LENGTH_STRUCT.size, execTime, roundTrip, latency)
+
+                    if(encodeTime != None):
+                        encodeTimes.append(encodeTime)
+                    if(decodeTime != None):
+                        decodeTimes.append(decodeTime)
+                    if(execTime != None and log == None):
+                        print(os.path.basename(input),",",framerate,",",bitrate,",",encodeTime,",",decodeTime,", encdec")
+
+                decodedSamples = interleave_channels([result[0][1] for result in channelResults])[:remaining]
+                remaining -= len(decodedSamples)
+
+                # The header is updated once when the file is closed
+                output_wav.writeframesraw(decodedSamples)
+                count += 1
+
+            if(remaining):
+                output_wav.writeframesraw(bytes(remaining))
+
+            output_wav.close()
+            output_bin.close()
+            wall = perf_counter() - wall
+
+            if(profile > 0):
+                print_summary("\nEncode execution time", encodeTimes, "cycles")
+                print_summary("\nDecode execution time", decodeTimes, "cycles")
+            print_summary("\nRound trip", frameLog.roundTrips, "ms")
+            print_rtf("\nEncode and decode real time factor", count, wall, count*float(frame_len)/1000)
+            if(pacer != None):
+                pacer.print_summary("\nEncode and decode real-time latency")
+
+            return 0
+        finally:
+            # The wav header can't be updated on a pipe after an error
+            if(output_wav != None):
+                try:
+                    output_wav.close()
+                except OSError:
+                    pass
+            if(output_file != None):
+                output_file.close()
+            if(output_bin != None):
+                output_bin.close()
+            if(input_wav != None):
+                input_wav.close()
+            if(frameLog != None):
+                frameLog.close()
+            input_file.close()
+
+### ------------------------------------------------------------------------ ###
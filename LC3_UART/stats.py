@@ -0,0 +1,101 @@
+#! /usr/bin/env python3
+
+################################################################################
+ # Copyright (C) 2020 Maxim Integrated Products, Inc., All Rights Reserved.
+ #
+ # Permission is hereby granted, free of charge, to any person obtaining a
+ # copy of this software and associated documentation files (the "Software"),
+ # to deal in the Software without restriction, including without limitation
+ # the rights to use, copy, modify, merge, publish, distribute, sublicense,
+ # and/or sell copies of the Software, and to permit persons to whom the
+ # Software is furnished to do so, subject to the following conditions:
+ #
+ # The above copyright notice and this permission notice shall be included
+ # in all copies or substantial portions of the Software.
+ #
+ # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+ # OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+ # MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+ # IN NO EVENT SHALL MAXIM INTEGRATED BE LIABLE FOR ANY CLAIM, DAMAGES
+ # OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+ # ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+ # OTHER DEALINGS IN THE SOFTWARE.
+ #
+ # Except as contained in this notice, the name of Maxim Integrated
+ # Products, Inc. shall not be used except as stated in the Maxim Integrated
+ # Products, Inc. Branding Policy.
+ #
+ # The mere transfer of this software does not imply any licenses
+ # of trade secrets, proprietary technology, copyrights, patents,
+ # trademarks, maskwork rights, or any other form of intellectual
+ # property whatsoever. Maxim Integrated Products, Inc. retains all
+ # ownership rights.
+ #
+ ###############################################################################
+
+## stats.py
+ #
+ # Summary statistics for per-frame measurements
+ #
+
+## Get a percentile from sorted values.
+ #
+ # Uses the nearest-rank method, p is in the range 0 to 100.
+################################################################################
+def percentile(values, p):
+    if(len(values) == 0):
+        return None
+
+    rank = int(round(p/100*(len(values)-1)))
+    return values[rank]
+
+## Summarize measurements.
+ #
+ # Returns a dictionary with the count, min, mean, percentiles and max of
+ # values, None entries are ignored.
+################################################################################
+def summary(values):
+    values = sorted(v for v in values if v != None)
+    if(len(values) == 0):
+        return {"count": 0}
+
+    return {
+        "count": len(values),
+        "min":   values[0],
+        "mean":  sum(values)/len(values),
+        "p50":   percentile(values, 50),
+        "p90":   percentile(values, 90),
+        "p99":   percentile(values, 99),
+        "max":   values[-1],
+    }
+
+## Print a summary block.
+################################################################################
+def print_summary(title, values, unit=""):
+    stats = summary(values)
+    print(title)
+    if(stats["count"] == 0):
+        print("  Samples      : 0")
+        return stats
+
+    print("  Samples      :", stats["count"])
+    for label, key in [("Min", "min"), ("Mean", "mean"), ("P50", "p50"),
+                       ("P90", "p90"), ("P99", "p99"), ("Max", "max")]:
+        print("  %-13s: %.1f %s" % (label, stats[key], unit))
+
+    return stats
+
+## Print the real time factor.
+ #
+ # The real time factor is the wall time over the audio time, below 1 is faster
+ # than real time.
+################################################################################
+def print_rtf(title, frames, wall, audio):
+    print(title)
+    print("  Frames       :", frames)
+    print("  Wall time    : %.3f s" % wall)
+    print("  Audio time   : %.3f s" % audio)
+    if(audio > 0):
+        print("  RTF          : %.3f" % (wall/audio))
+
+### ------------------------------------------------------------------------ ###
@@ -0,0 +1,36 @@
+import os
+import pathlib
+import sys
+
+import pytest
+
+# The tools are run from their directory and aren't a package
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from emulator import Emulator, Liblc3Backend, NullBackend
+from hci import HCI
+from pool import open_serial
+
+
+# Open HCIs on emulators, the pseudo-terminals are closed after the test
+@pytest.fixture
+def device():
+    opened = []
+
+    def open_device(backend=None, **options):
+        emulator = Emulator(backend if backend is not None else NullBackend(), **options)
+        hci = HCI(open_serial(emulator.start(), 2000000))
+        opened.append((emulator, hci))
+        return hci
+
+    yield open_device
+    for emulator, hci in opened:
+        hci.serial_port.close()
+        os.close(emulator.master)
+        os.close(emulator.slave)
+
+
+@pytest.fixture
+def liblc3():
+    pytest.importorskip('lc3')
+    return Liblc3Backend
@@ -0,0 +1,57 @@
+import wave
+from array import array
+
+from bitstream import wav_frames, write_bin_header
+from channels import interleave_channels, split_channels
+from emulator import Liblc3Backend
+from hci import LENGTH_STRUCT, frame_duration_code
+
+
+# Write a wav file of a chirp with a different level per channel
+def write_wav(path, rate=16000, channels=1, seconds=1.0):
+    count = int(rate*seconds)
+    samples = array('h')
+    for i in range(count):
+        for c in range(channels):
+            samples.append(int(8000/(c + 1)*((i*i//97 + 31*i) % 200 - 100)/100))
+    with wave.open(str(path), 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(samples.tobytes())
+    return path
+
+
+# The .bin file and the decoded samples of a wav file, computed with the backend without the host tools
+def reference(path, bitrate, frame_ms=10, backend=Liblc3Backend):
+    with wave.open(str(path), 'rb') as wf:
+        rate, channels, nframes = wf.getframerate(), wf.getnchannels(), wf.getnframes()
+        frame_samples = int(rate*float(frame_ms)/1000)
+        frames = [split_channels(frame, channels) for frame in wav_frames(wf, frame_samples)]
+
+    code = frame_duration_code(frame_ms)
+    codecs = [backend() for c in range(channels)]
+    for codec in codecs:
+        codec.init_encoder(code, rate, int(bitrate)//channels)
+        codec.init_decoder(code, rate, int(bitrate)//channels)
+
+    class Bin(bytearray):
+        def write(self, data):
+            self.extend(data)
+
+    encoded = Bin()
+    write_bin_header(encoded, rate, bitrate, channels, frame_ms, nframes)
+    decoded = bytearray()
+    for frame in frames:
+        samples = []
+        for codec, channelFrame in zip(codecs, frame):
+            data = codec.encode(channelFrame)
+            encoded += LENGTH_STRUCT.pack(len(data)) + data
+            samples.append(codec.decode(data))
+        decoded += interleave_channels(samples)
+    return bytes(encoded), bytes(decoded)
+
+
+def read_samples(path):
+    with wave.open(str(path), 'rb') as wf:
+        return wf.readframes(wf.getnframes())
@@ -0,0 +1,57 @@
+import pytest
+
+from hci import MAX_BATCH
+
+
+def test_negotiate(device):
+    hci = device(max_batch=8)
+    assert hci.negotiate() == 8
+    assert hci.version == 1
+    assert hci.frames_per_command(4) == 4
+    assert hci.frames_per_command(32) == 8
+    assert hci.frames_per_command(1) == 1
+
+
+def test_negotiate_without_batches(device):
+    hci = device()
+    assert hci.negotiate() == 1
+    assert hci.version is None
+
+    # Not answering isn't remembered
+    hci.reset_negotiation()
+    assert hci.max_batch is None
+
+
+def test_negotiate_clamps_batches(device):
+    hci = device(max_batch=MAX_BATCH*4)
+    assert hci.negotiate() == MAX_BATCH
+    assert hci.version == 1
+    assert hci.frames_per_command(MAX_BATCH*2) == MAX_BATCH
+
+
+def test_negotiate_on_corrupted_link(device):
+    hci = device(max_batch=8, corrupt=0.2, drop=0.1, seed=3)
+    answers = set()
+    for attempt in range(30):
+        hci.max_batch = hci.version = None
+        answers.add((hci.negotiate(), hci.version))
+    assert answers <= {(8, 1), (1, None)}
+    assert (8, 1) in answers
+
+
+def test_framing_clamps_batches(device):
+    hci = device(max_batch=MAX_BATCH*4, framing=True)
+    assert hci.enable_framing()
+    assert hci.max_batch == MAX_BATCH
+    hci.disable_framing()
+    assert not hci.framing
+
+
+@pytest.mark.parametrize('max_batch', [0, 16])
+def test_framing_on_corrupted_link(device, max_batch):
+    hci = device(max_batch=max_batch, framing=True, corrupt=0.05, drop=0.05, seed=11)
+    for attempt in range(10):
+        hci.max_batch = hci.version = None
+        if(hci.enable_framing()):
+            assert hci.max_batch == max(max_batch, 1)
+        hci.disable_framing()
@@ -0,0 +1,130 @@
+import pytest
+
+from emulated import read_samples, reference, write_wav
+from emulator import SingleInstanceBackend
+from job import run_job
+
+
+def job(command, src, out, **options):
+    job = {'command': command, 'INPUT': str(src), 'OUTPUT': str(out), 'BITRATE': '32000', 'frame_ms': '10',
+           'window': 1, 'profile': 1}
+    job.update(options)
+    return job
+
+
+# Encode, decode and encode and decode the item, the outputs must be the ones of the codec
+def check_jobs(hci, tmp_path, src, devices=[], bitrate='32000', frame_ms='10', **options):
+    encoded, decoded = reference(src, bitrate, frame_ms)
+    assert run_job(hci, job('E', src, tmp_path / 'e.bin', BITRATE=bitrate, frame_ms=frame_ms, **options), devices) == 0
+    assert (tmp_path / 'e.bin').read_bytes() == encoded
+    assert run_job(hci, job('D', tmp_path / 'e.bin', tmp_path / 'd.wav', **options), devices) == 0
+    assert read_samples(tmp_path / 'd.wav') == decoded
+    assert run_job(hci, job('ED', src, tmp_path / 'ed.wav', BIN=str(tmp_path / 'ed.bin'), BITRATE=bitrate,
+                            frame_ms=frame_ms, **options), devices) == 0
+    assert (tmp_path / 'ed.bin').read_bytes() == encoded
+    assert read_samples(tmp_path / 'ed.wav') == decoded
+
+
+@pytest.mark.parametrize('frame_ms, rate', [('10', 16000), ('7.5', 48000)])
+def test_bit_exact(tmp_path, device, liblc3, frame_ms, rate):
+    src = write_wav(tmp_path / 'in.wav', rate, seconds=0.5)
+    check_jobs(device(liblc3()), tmp_path, src, frame_ms=frame_ms)
+
+
+@pytest.mark.parametrize('window, profile', [(4, 1), (8, 3), (3, 0)])
+def test_pipelined(tmp_path, device, liblc3, window, profile):
+    src = write_wav(tmp_path / 'in.wav', seconds=0.5)
+    check_jobs(device(liblc3()), tmp_path, src, window=window, profile=profile)
+
+
+@pytest.mark.parametrize('max_batch, batch, window', [(8, 8, 1), (4, 16, 2), (0, 8, 1)])
+def test_batches(tmp_path, device, liblc3, max_batch, batch, window):
+    src = write_wav(tmp_path / 'in.wav', seconds=0.5)
+    check_jobs(device(liblc3(), max_batch=max_batch), tmp_path, src, batch=batch, window=window)
+
+
+@pytest.mark.parametrize('drop, corrupt, garbage', [(0.05, 0.0, 0.0), (0.0, 0.05, 0.0), (0.03, 0.03, 0.03)])
+def test_framing_recovers(tmp_path, device, liblc3, drop, corrupt, garbage):
+    src = write_wav(tmp_path / 'in.wav', seconds=0.5)
+    hci = device(liblc3(), framing=True, max_batch=4, drop=drop, corrupt=corrupt, garbage=garbage, seed=7)
+    check_jobs(hci, tmp_path, src, framing=True, window=4)
+    check_jobs(hci, tmp_path, src, framing=True, window=2, batch=4)
+    assert not hci.framing
+
+
+def test_framing_not_supported(tmp_path, device):
+    src = write_wav(tmp_path / 'in.wav', seconds=0.1)
+    assert run_job(device(), job('E', src, tmp_path / 'e.bin', framing=True)) == 1
+
+
+@pytest.mark.parametrize('devices', [0, 1])
+def test_multichannel(tmp_path, device, liblc3, devices):
+    src = write_wav(tmp_path / 'in.wav', channels=2, seconds=0.5)
+    check_jobs(device(liblc3()), tmp_path, src, [device(liblc3()) for d in range(devices)], bitrate='64000',
+               window=2)
+
+
+def test_single_codec_instance(tmp_path, device, liblc3):
+    src = write_wav(tmp_path / 'in.wav', channels=2, seconds=0.5)
+    hci = device(SingleInstanceBackend(liblc3()))
+    check_jobs(hci, tmp_path, src, bitrate='64000')
+    assert hci.separate_codecs is False
+
+
+def test_separate_codec_instances(tmp_path, device, liblc3):
+    src = write_wav(tmp_path / 'in.wav', seconds=0.2)
+    hci = device(liblc3())
+    check_jobs(hci, tmp_path, src)
+    assert hci.separate_codecs is True
+
+
+# Backend failing the encode or decode calls given by their number
+class Failing:
+
+    def __init__(self, backend, failures):
+        self.backend = backend
+        self.failures = set(failures)
+        self.calls = 0
+
+    def init_encoder(self, *args):
+        self.backend.init_encoder(*args)
+
+    def init_decoder(self, *args):
+        self.backend.init_decoder(*args)
+
+    def fail(self):
+        self.calls += 1
+        if(self.calls in self.failures):
+            self.failures.discard(self.calls)
+            raise RuntimeError('failure')
+
+    def encode(self, samples):
+        self.fail()
+        return self.backend.encode(samples)
+
+    def decode(self, data):
+        self.fail()
+        return self.backend.decode(data)
+
+
+def resume(hci, job, runs=5):
+    results = [run_job(hci, dict(job, resume=True)) for run in range(runs)]
+    return results[:results.index(0) + 1] if 0 in results else results
+
+
+@pytest.mark.parametrize('failures', [[150], [250, 420], [299]])
+def test_resume_is_bit_exact(tmp_path, device, liblc3, failures):
+    src = write_wav(tmp_path / 'in.wav', seconds=3)
+    encoded, decoded = reference(src, '32000')
+
+    # Each failure stops a run, the next run resumes from the last checkpoint
+    backend = Failing(liblc3(), failures)
+    hci = device(backend)
+    assert resume(hci, job('E', src, tmp_path / 'e.bin')) == [1]*len(failures) + [0]
+    assert (tmp_path / 'e.bin').read_bytes() == encoded
+
+    backend.calls = 0
+    backend.failures = set(failures)
+    assert resume(hci, job('D', tmp_path / 'e.bin', tmp_path / 'd.wav')) == [1]*len(failures) + [0]
+    assert read_samples(tmp_path / 'd.wav') == decoded
+    assert not (tmp_path / 'd.wav.ckpt').exists()